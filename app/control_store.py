@@ -0,0 +1,660 @@
+import bisect
+import csv
+import heapq
+import json
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from pydantic import BaseModel
+
+
+# --- Data Model ---
+class Section(BaseModel):
+    id_slug: str
+    title: str
+    helper_text: str
+    placeholder: str
+
+
+class Control(BaseModel):
+    id: str
+    name: str
+    risk_id: Optional[str] = None
+    status: Optional[str] = None
+    owner: Optional[str] = None
+    risk_text: Optional[str] = None
+    description: str
+    sections: List[Section]
+    # Removed AI-related fields like 'suggestions' and 'assessment_document' for now
+
+
+# --- Search index ---
+# Searchable fields and how much a match in each one counts towards the rank
+SEARCH_FIELD_WEIGHTS = {
+    "name": 3.0,
+    "risk_id": 3.0,
+    "owner": 2.0,
+    "status": 1.0,
+    "risk_text": 1.0,
+    "description": 1.0,
+}
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def trigrams(text: str) -> Set[str]:
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+class SearchPage(BaseModel):
+    controls: List[Control]
+    total: int
+    page: int
+    page_size: int
+
+    @property
+    def next_page(self) -> Optional[int]:
+        return self.page + 1 if self.page * self.page_size < self.total else None
+
+
+class ControlSearchIndex:
+    """
+    Incrementally maintained inverted index over the searchable control fields.
+
+    Each word of a control maps to the controls containing it, together with the
+    summed weight of the fields it appears in. Query words are resolved against
+    the vocabulary rather than the controls: words of three or more characters
+    through a trigram index over the vocabulary (so they match anywhere inside a
+    word), shorter ones as word prefixes. Every query word must match; results
+    are ranked by field weight and match quality (whole word > prefix > substring).
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[str, float]] = {}  # word -> {control id: field weight}
+        self._words: Dict[str, Set[str]] = {}  # control id -> its words, for removal
+        self._vocabulary: List[str] = []  # sorted, for prefix lookups
+        self._vocabulary_sorted = True  # False only inside bulk_load()
+        self._vocabulary_trigrams: Dict[str, Set[str]] = {}  # trigram -> words containing it
+        self._controls: Dict[str, Control] = {}
+        self._position: Dict[str, int] = {}  # catalog order, for stable ranking ties
+        self._next_position = 0
+        self._word_count = 0  # sum of len(self._words[...]), for query planning
+
+    def __len__(self) -> int:
+        return len(self._controls)
+
+    def add(self, control: Control):
+        if control.id in self._controls:
+            self.remove(control.id, keep_position=True)
+        if control.id not in self._position:
+            self._position[control.id] = self._next_position
+            self._next_position += 1
+
+        word_weights: Dict[str, float] = {}
+        for field, weight in SEARCH_FIELD_WEIGHTS.items():
+            text = (getattr(control, field) or "").lower()
+            for word in set(TOKEN_PATTERN.findall(text)):
+                word_weights[word] = word_weights.get(word, 0.0) + weight
+
+        for word, weight in word_weights.items():
+            posting = self._postings.get(word)
+            if posting is None:
+                posting = self._postings[word] = {}
+                self._add_to_vocabulary(word)
+            posting[control.id] = weight
+        self._words[control.id] = set(word_weights)
+        self._word_count += len(word_weights)
+        self._controls[control.id] = control
+
+    def update(self, control: Control):
+        self.add(control)
+
+    @contextmanager
+    def bulk_load(self):
+        """Defers sorting the vocabulary to the end: one sort instead of an insort per new word."""
+        self._vocabulary_sorted = False
+        try:
+            yield
+        finally:
+            self._vocabulary.sort()
+            self._vocabulary_sorted = True
+
+    def remove(self, control_id: str, keep_position: bool = False):
+        words = self._words.pop(control_id, set())
+        self._word_count -= len(words)
+        for word in words:
+            posting = self._postings.get(word)
+            if posting is None:
+                continue
+            posting.pop(control_id, None)
+            if not posting:
+                del self._postings[word]
+                self._remove_from_vocabulary(word)
+        self._controls.pop(control_id, None)
+        if not keep_position:
+            self._position.pop(control_id, None)
+
+    def _add_to_vocabulary(self, word: str):
+        if self._vocabulary_sorted:
+            bisect.insort(self._vocabulary, word)
+        else:
+            self._vocabulary.append(word)
+        for gram in trigrams(word):
+            self._vocabulary_trigrams.setdefault(gram, set()).add(word)
+
+    def _remove_from_vocabulary(self, word: str):
+        if not self._vocabulary_sorted:
+            self._vocabulary.remove(word)
+        else:
+            i = bisect.bisect_left(self._vocabulary, word)
+            if i < len(self._vocabulary) and self._vocabulary[i] == word:
+                del self._vocabulary[i]
+        for gram in trigrams(word):
+            words = self._vocabulary_trigrams.get(gram)
+            if words is not None:
+                words.discard(word)
+                if not words:
+                    del self._vocabulary_trigrams[gram]
+
+    def _matching_words(self, query_word: str) -> List[Tuple[str, float]]:
+        """Vocabulary words matching a query word, with a match-quality multiplier."""
+        if len(query_word) < 3:
+            vocabulary = self._vocabulary
+            i = bisect.bisect_left(vocabulary, query_word)
+            matches = []
+            while i < len(vocabulary) and vocabulary[i].startswith(query_word):
+                matches.append((vocabulary[i], 3.0 if vocabulary[i] == query_word else 2.0))
+                i += 1
+            return matches
+
+        gram_sets = sorted(
+            (self._vocabulary_trigrams.get(gram, set()) for gram in trigrams(query_word)),
+            key=len,
+        )
+        if not gram_sets[0]:
+            return []
+        matches = []
+        for word in gram_sets[0].intersection(*gram_sets[1:]):
+            if word == query_word:
+                matches.append((word, 3.0))
+            elif word.startswith(query_word):
+                matches.append((word, 2.0))
+            elif query_word in word:
+                matches.append((word, 1.0))
+        return matches
+
+    def _score_postings(self, matches: Dict[str, float]) -> Dict[str, float]:
+        """Best score per control over the postings of the matched vocabulary words."""
+        scores: Dict[str, float] = {}
+        # Best quality first, so most controls are settled by the first posting
+        for word, quality in sorted(matches.items(), key=lambda m: -m[1]):
+            posting = self._postings[word]
+            if not scores:
+                scores = {cid: quality * weight for cid, weight in posting.items()}
+                continue
+            for control_id, weight in posting.items():
+                score = quality * weight
+                if score > scores.get(control_id, 0.0):
+                    scores[control_id] = score
+        return scores
+
+    def search(self, query: str, page: int = 1, page_size: int = 50) -> SearchPage:
+        """Returns one page of matching controls, best match first."""
+        page = max(page, 1)
+        # (posting entries to scan, {vocabulary word: match quality}) per query word
+        query_words = []
+        for query_word in set(TOKEN_PATTERN.findall(query.lower())):
+            matches = dict(self._matching_words(query_word))
+            query_words.append((sum(len(self._postings[w]) for w in matches), matches))
+        # Start from the most selective query word
+        query_words.sort(key=lambda entry: entry[0])
+        words_per_control = self._word_count / max(len(self._controls), 1)
+
+        scores: Optional[Dict[str, float]] = None
+        for postings_size, matches in query_words:
+            if scores is None:
+                scores = self._score_postings(matches)
+            elif len(scores) * words_per_control < postings_size:
+                # Few candidates left: check their own words instead of scanning postings
+                narrowed = {}
+                for control_id, score in scores.items():
+                    word_score = max(
+                        (
+                            matches[word] * self._postings[word][control_id]
+                            for word in self._words[control_id]
+                            if word in matches
+                        ),
+                        default=0.0,
+                    )
+                    if word_score:
+                        narrowed[control_id] = score + word_score
+                scores = narrowed
+            else:
+                word_scores = self._score_postings(matches)
+                scores = {
+                    control_id: score + word_scores[control_id]
+                    for control_id, score in scores.items()
+                    if control_id in word_scores
+                }
+            if not scores:
+                break
+
+        scores = scores or {}
+        top = heapq.nsmallest(
+            page * page_size,
+            ((-score, self._position[control_id], control_id) for control_id, score in scores.items()),
+        )
+        return SearchPage(
+            controls=[self._controls[cid] for _, _, cid in top[(page - 1) * page_size :]],
+            total=len(scores),
+            page=page,
+            page_size=page_size,
+        )
+
+
+# --- Indexed, in-memory control repository ---
+class ControlRepository:
+    """
+    Holds the control catalog with O(1) lookups by id and secondary indexes by
+    risk_id and owner, plus a ControlSearchIndex for /search. The id index is
+    insertion-ordered, so it doubles as the ordered list view used by the templates.
+    `version` increases on every add, update and remove, so anything derived from
+    the catalog can be cached against it.
+    """
+
+    def __init__(self, controls: Iterable[Control] = ()):
+        self._by_id: Dict[str, Control] = {}
+        self._by_risk_id: Dict[str, Dict[str, Control]] = {}
+        self._by_owner: Dict[str, Dict[str, Control]] = {}
+        self._ordered: Optional[List[Control]] = None
+        self.search_index = ControlSearchIndex()
+        self.version = 0
+        self.add_many(controls)
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __iter__(self) -> Iterator[Control]:
+        return iter(self.all())
+
+    def __contains__(self, control_id: str) -> bool:
+        return control_id in self._by_id
+
+    def all(self) -> List[Control]:
+        """All controls in catalog order. The list is shared; callers must not mutate it."""
+        if self._ordered is None:
+            self._ordered = list(self._by_id.values())
+        return self._ordered
+
+    def get(self, control_id: str) -> Optional[Control]:
+        return self._by_id.get(control_id)
+
+    def by_risk_id(self, risk_id: str) -> List[Control]:
+        return list(self._by_risk_id.get(risk_id, {}).values())
+
+    def by_owner(self, owner: str) -> List[Control]:
+        return list(self._by_owner.get(owner, {}).values())
+
+    def search(self, query: str, page: int = 1, page_size: int = 50) -> SearchPage:
+        """One page of controls matching the query; an empty query pages through the catalog."""
+        if TOKEN_PATTERN.search(query.lower()):
+            return self.search_index.search(query, page=page, page_size=page_size)
+        page = max(page, 1)
+        start = (page - 1) * page_size
+        ordered = self.all()
+        return SearchPage(
+            controls=ordered[start : start + page_size],
+            total=len(ordered),
+            page=page,
+            page_size=page_size,
+        )
+
+    def add(self, control: Control):
+        if control.id in self._by_id:
+            raise ValueError(f"Control '{control.id}' already exists")
+        self._by_id[control.id] = control
+        self._index(control)
+        self.search_index.add(control)
+        self._ordered = None
+        self.version += 1
+
+    def add_many(self, controls: Iterable[Control]):
+        """Adds a batch of controls, e.g. the whole catalog at startup."""
+        with self.search_index.bulk_load():
+            for control in controls:
+                self.add(control)
+
+    def update(self, control_id: str, changes: dict) -> Optional[Control]:
+        """Applies field changes in place and keeps the secondary indexes consistent."""
+        control = self._by_id.get(control_id)
+        if control is None:
+            return None
+        self._unindex(control)
+        for field, value in changes.items():
+            setattr(control, field, value)
+        self._index(control)
+        self.search_index.update(control)
+        self.version += 1
+        return control
+
+    def remove(self, control_id: str) -> Optional[Control]:
+        control = self._by_id.pop(control_id, None)
+        if control is not None:
+            self._unindex(control)
+            self.search_index.remove(control_id)
+            self._ordered = None
+            self.version += 1
+        return control
+
+    def _index(self, control: Control):
+        if control.risk_id:
+            self._by_risk_id.setdefault(control.risk_id, {})[control.id] = control
+        if control.owner:
+            self._by_owner.setdefault(control.owner, {})[control.id] = control
+
+    def _unindex(self, control: Control):
+        for index, key in (
+            (self._by_risk_id, control.risk_id),
+            (self._by_owner, control.owner),
+        ):
+            bucket = index.get(key)
+            if bucket is None:
+                continue
+            bucket.pop(control.id, None)
+            if not bucket:
+                del index[key]
+
+
+# --- Transactional control persistence (SQLite) ---
+CSV_FIELDNAMES = list(Control.model_fields.keys())
+
+
+def control_from_csv_row(row: dict) -> Control:
+    # Parse the JSON string from the 'sections' column
+    row = dict(row)
+    row["sections"] = json.loads(row["sections"]) if row.get("sections") else []
+    return Control(**row)
+
+
+def control_to_csv_row(control: Control) -> dict:
+    row = control.model_dump()
+    # Convert the 'sections' list back to a JSON string for CSV storage
+    row["sections"] = json.dumps(row["sections"])
+    return row
+
+
+class ControlDatabase:
+    """
+    Embedded SQLite store for the control catalog. Every admin add, update or
+    delete is a single-row statement in its own transaction, so its cost doesn't
+    depend on the size of the catalog. Sections are kept as a JSON column, and
+    controls.csv stays supported through import_csv/export_csv.
+
+    Methods block on disk I/O; call them from a worker thread in async code.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            # 'position' keeps the catalog in insertion order, like the CSV file did
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS controls (
+                    position INTEGER PRIMARY KEY AUTOINCREMENT,
+                    id TEXT NOT NULL UNIQUE,
+                    name TEXT NOT NULL,
+                    risk_id TEXT,
+                    status TEXT,
+                    owner TEXT,
+                    risk_text TEXT,
+                    description TEXT NOT NULL,
+                    sections TEXT NOT NULL DEFAULT '[]'
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS store_metadata (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM controls").fetchone()[0]
+
+    def seeded(self) -> bool:
+        """
+        Whether the catalog was ever imported, so an emptied catalog is not
+        re-imported. A database with controls but no marker predates it and is
+        marked now.
+        """
+        with self._lock, self._conn:
+            if self._conn.execute("SELECT 1 FROM store_metadata WHERE key = 'seeded_from'").fetchone():
+                return True
+            if not self._conn.execute("SELECT 1 FROM controls LIMIT 1").fetchone():
+                return False
+            self._conn.execute("INSERT INTO store_metadata (key, value) VALUES ('seeded_from', 'existing rows')")
+            return True
+
+    def load_all(self) -> List[Control]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(CSV_FIELDNAMES)} FROM controls ORDER BY position"
+            ).fetchall()
+        return [control_from_csv_row(dict(row)) for row in rows]
+
+    def insert(self, control: Control):
+        row = control_to_csv_row(control)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT INTO controls ({', '.join(CSV_FIELDNAMES)}) "
+                f"VALUES ({', '.join(':' + f for f in CSV_FIELDNAMES)})",
+                row,
+            )
+
+    def update(self, control: Control):
+        row = control_to_csv_row(control)
+        assignments = ", ".join(f"{f} = :{f}" for f in CSV_FIELDNAMES if f != "id")
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                f"UPDATE controls SET {assignments} WHERE id = :id", row
+            )
+            if cursor.rowcount == 0:
+                raise KeyError(control.id)
+
+    def delete(self, control_id: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM controls WHERE id = ?", (control_id,))
+
+    def import_csv(self, csv_path: Path) -> int:
+        """Loads controls.csv into the database in one transaction; returns the row count."""
+        with open(csv_path, mode="r", encoding="utf-8") as infile:
+            controls = [control_from_csv_row(row) for row in csv.DictReader(infile)]
+        rows = [control_to_csv_row(control) for control in controls]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO controls ({', '.join(CSV_FIELDNAMES)}) "
+                f"VALUES ({', '.join(':' + f for f in CSV_FIELDNAMES)})",
+                rows,
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO store_metadata (key, value) VALUES ('seeded_from', ?)",
+                (csv_path.name,),
+            )
+        return len(rows)
+
+    def export_csv(self, outfile):
+        """Writes the catalog in the controls.csv format to an open text file."""
+        writer = csv.DictWriter(outfile, fieldnames=CSV_FIELDNAMES)
+        writer.writeheader()
+        for control in self.load_all():
+            writer.writerow(control_to_csv_row(control))
+
+
+# --- Append-only journal persistence ---
+class JournaledControlStore:
+    """
+    Alternative to ControlDatabase with the same interface, for deployments
+    without a database. The catalog lives in a CSV snapshot (controls.csv
+    format) plus an append-only journal of compact JSON change records. Each
+    add, update or delete appends one record and fsyncs it. Startup replays
+    the snapshot and then the journal. A torn final record from a crash
+    mid-append is dropped and cut off the journal.
+
+    compact() folds the journal into a new snapshot. It writes a temp file,
+    fsyncs it and atomically renames it over the old snapshot, so readers never
+    see a torn file. Writes go on during compaction: the journal is rotated
+    first, and the rotated file is only removed once the new snapshot is in place.
+    """
+
+    def __init__(self, snapshot_path: Path, journal_path: Path):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        self.compacting_path = journal_path.with_name(journal_path.name + ".compacting")
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._rows: Dict[str, dict] = {}  # control id -> CSV row, in catalog order
+        self.journal_records = 0
+        self._replay()
+        self._journal = open(self.journal_path, mode="a", encoding="utf-8")
+
+    def _replay(self):
+        try:
+            with open(self.snapshot_path, mode="r", encoding="utf-8") as infile:
+                for row in csv.DictReader(infile):
+                    self._rows[row["id"]] = {f: row.get(f) for f in CSV_FIELDNAMES}
+        except FileNotFoundError:
+            pass
+        # A journal left behind by an interrupted compaction is replayed first;
+        # records are whole-row upserts and deletes, so replaying them twice is harmless
+        for path in (self.compacting_path, self.journal_path):
+            try:
+                with open(path, mode="rb") as infile:
+                    data = infile.read()
+            except FileNotFoundError:
+                continue
+            # Every record ends with a newline, written and fsynced with it, so
+            # anything after the last newline was never acknowledged
+            complete = data.rfind(b"\n") + 1
+            for line in data[:complete].decode("utf-8").splitlines():
+                if line:
+                    self._apply(json.loads(line))
+                    self.journal_records += 1
+            if complete < len(data):
+                # Torn final record from a crash mid-append: cut it off, or the
+                # next record would be appended to the fragment
+                with open(path, mode="r+b") as journal:
+                    journal.truncate(complete)
+                    os.fsync(journal.fileno())
+
+    def _apply(self, record: dict):
+        if record["op"] == "delete":
+            self._rows.pop(record["id"], None)
+        else:
+            self._rows[record["row"]["id"]] = record["row"]
+
+    def _append(self, record: dict):
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._lock:
+            self._journal.write(line)
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self._apply(record)
+            self.journal_records += 1
+
+    def close(self):
+        with self._lock:
+            self._journal.close()
+
+    def count(self) -> int:
+        return len(self._rows)
+
+    def seeded(self) -> bool:
+        # The snapshot is written by the first import (or is controls.csv itself), so
+        # once it exists an empty catalog means every control was deleted
+        return self.snapshot_path.exists() or self.journal_path.stat().st_size > 0
+
+    def load_all(self) -> List[Control]:
+        with self._lock:
+            rows = list(self._rows.values())
+        return [control_from_csv_row(row) for row in rows]
+
+    def insert(self, control: Control):
+        self._append({"op": "upsert", "row": control_to_csv_row(control)})
+
+    def update(self, control: Control):
+        if control.id not in self._rows:
+            raise KeyError(control.id)
+        self._append({"op": "upsert", "row": control_to_csv_row(control)})
+
+    def delete(self, control_id: str):
+        self._append({"op": "delete", "id": control_id})
+
+    def import_csv(self, csv_path: Path) -> int:
+        with open(csv_path, mode="r", encoding="utf-8") as infile:
+            rows = [control_to_csv_row(control_from_csv_row(r)) for r in csv.DictReader(infile)]
+        with self._lock:
+            for row in rows:
+                self._rows[row["id"]] = row
+        self.compact()
+        return len(rows)
+
+    def export_csv(self, outfile):
+        with self._lock:
+            rows = list(self._rows.values())
+        writer = csv.DictWriter(outfile, fieldnames=CSV_FIELDNAMES)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    def compact(self):
+        """Folds the journal into a fresh snapshot; blocking, run it off the event loop."""
+        with self._compact_lock:
+            self._compact()
+
+    def _compact(self):
+        with self._lock:
+            if self.compacting_path.exists():
+                # Left over from an interrupted compaction; its records are already in _rows
+                self.compacting_path.unlink()
+            self._journal.close()
+            if self.journal_path.exists():
+                os.replace(self.journal_path, self.compacting_path)
+            self._journal = open(self.journal_path, mode="a", encoding="utf-8")
+            rows = list(self._rows.values())
+            self.journal_records = 0
+
+        tmp_path = self.snapshot_path.with_name(self.snapshot_path.name + ".tmp")
+        with open(tmp_path, mode="w", newline="", encoding="utf-8") as outfile:
+            writer = csv.DictWriter(outfile, fieldnames=CSV_FIELDNAMES)
+            writer.writeheader()
+            writer.writerows(rows)
+            outfile.flush()
+            os.fsync(outfile.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        _fsync_directory(self.snapshot_path.parent)
+        self.compacting_path.unlink(missing_ok=True)
+
+
+def _fsync_directory(directory: Path):
+    # Makes a rename durable; not supported on every platform/filesystem
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
@@ -0,0 +1,87 @@
+"""
+Local stand-in for the Vertex AI GenerativeModel, selected with
+MODEL_BACKEND=fake, so load tests and benchmarks exercise the AI endpoints
+without spending quota. Latency, failures and the response text are drawn from
+a generator seeded by the seed and the prompt, so a run with the same prompts
+sees the same model behavior however the calls interleave.
+"""
+
+import asyncio
+import hashlib
+import random
+from typing import AsyncIterator, NamedTuple
+
+WORDS = (
+    "control risk access review evidence owner quarterly policy exception "
+    "approval monitoring vendor encryption backup incident remediation audit "
+    "segregation duties change management logging retention assessment"
+).split()
+
+
+class FakeModelError(RuntimeError):
+    """Raised in place of the upstream errors (quota, unavailable) a real call can fail with."""
+
+
+class FakeResponse(NamedTuple):
+    text: str
+
+
+class FakeGenerativeModel:
+    """
+    Answers generate_content_async like GenerativeModel. Each call takes a
+    log-normally distributed time with median latency_ms (latency_sigma 0 makes
+    it fixed) and fails with probability error_rate. A streamed call yields
+    stream_chunks chunks, the first after first_chunk_share of the call's
+    latency and the rest evenly over the remainder; a failing stream raises
+    after a random number of chunks, as a dropped upstream stream would.
+    """
+
+    def __init__(
+        self,
+        latency_ms: float = 800.0,
+        latency_sigma: float = 0.5,
+        error_rate: float = 0.0,
+        stream_chunks: int = 20,
+        first_chunk_share: float = 0.3,
+        response_words: int = 120,
+        seed: int = 0,
+    ):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.stream_chunks = max(1, stream_chunks)
+        self.first_chunk_share = first_chunk_share
+        self.response_words = response_words
+        self.seed = seed
+
+    def _rng(self, prompt: str) -> random.Random:
+        digest = hashlib.sha256(f"{self.seed}:{prompt}".encode("utf-8")).digest()
+        return random.Random(int.from_bytes(digest[:8], "big"))
+
+    def _draw(self, rng: random.Random):
+        latency = self.latency_ms / 1000 * rng.lognormvariate(0, self.latency_sigma)
+        fails = rng.random() < self.error_rate
+        words = rng.choices(WORDS, k=self.response_words)
+        return latency, fails, " ".join(words).capitalize() + "."
+
+    async def generate_content_async(self, prompt: str, stream: bool = False):
+        latency, fails, text = self._draw(self._rng(prompt))
+        if stream:
+            return self._stream(latency, fails, text, self._rng(prompt + ":stream"))
+        await asyncio.sleep(latency)
+        if fails:
+            raise FakeModelError("503 fake model unavailable")
+        return FakeResponse(text)
+
+    async def _stream(self, latency: float, fails: bool, text: str, rng: random.Random) -> AsyncIterator[FakeResponse]:
+        words = text.split(" ")
+        per_chunk = -(-len(words) // self.stream_chunks)
+        chunks = [" ".join(words[i:i + per_chunk]) + " " for i in range(0, len(words), per_chunk)]
+        fail_after = rng.randrange(len(chunks)) if fails else None
+        first_delay = latency * self.first_chunk_share
+        chunk_delay = (latency - first_delay) / max(1, len(chunks) - 1)
+        for index, chunk in enumerate(chunks):
+            await asyncio.sleep(first_delay if index == 0 else chunk_delay)
+            if index == fail_after:
+                raise FakeModelError("503 fake model stream interrupted")
+            yield FakeResponse(chunk)
@@ -0,0 +1,35 @@
+"""
+Gunicorn settings, picked up automatically from the working directory (/app in
+the image). Sizes the worker pool and prepares the shared directory
+prometheus_client uses to aggregate /metrics across workers.
+"""
+
+import os
+import shutil
+import tempfile
+
+# Must be set before prometheus_client is first imported: it picks its value
+# storage at import time, and the workers inherit the master's modules
+os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "prometheus_multiproc")
+)
+
+from prometheus_client import multiprocess  # noqa: E402
+
+# Workers share users and the catalog through shared_state.db, so one per core
+# is safe. The journal control store keeps its rows in-process: single worker.
+if os.getenv("CONTROLS_STORE", "sqlite").lower() == "journal":
+    workers = 1
+else:
+    workers = int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1))
+
+
+def on_starting(server):
+    directory = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    # Samples left over from a previous run would otherwise be summed in
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+
+
+def child_exit(server, worker):
+    multiprocess.mark_process_dead(worker.pid)
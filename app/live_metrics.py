@@ -0,0 +1,176 @@
+"""
+Live dashboard metrics: per-day active users, interactions and per-endpoint
+interactions, counted in process as AI calls are logged. Every worker
+checkpoints its own counts to a file in a shared directory (on Cloud Run, the
+mounted bucket next to metrics.json, so instances share it too) and merges
+everyone's files into the numbers /api/metrics serves.
+"""
+
+import asyncio
+import json
+import os
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Optional, Set
+
+import structlog
+from pydantic import BaseModel, Field
+
+log = structlog.get_logger()
+
+
+class DayAggregate(BaseModel):
+    users: Set[str] = Field(default_factory=set)
+    # Calls that reached the model; cache hits only make their user active,
+    # as in the metrics job
+    interactions: int = 0
+    endpoints: Dict[str, int] = Field(default_factory=dict)
+
+    def merge(self, other: "DayAggregate"):
+        self.users |= other.users
+        self.interactions += other.interactions
+        for endpoint_name, count in other.endpoints.items():
+            self.endpoints[endpoint_name] = self.endpoints.get(endpoint_name, 0) + count
+
+
+class LiveMetrics:
+    """
+    This process's counts for the last window_days (keyed by ISO day, UTC) and
+    the merge of every process's last checkpoint. record() is called on the
+    event loop; checkpoint() does the file I/O in a worker thread.
+    """
+
+    def __init__(self, directory: Optional[Path], window_days: int = 30):
+        self.directory = directory
+        self.window_days = window_days
+        # One file per process, so workers never write the same file
+        self.path = directory / f"live-{uuid.uuid4().hex}.json" if directory else None
+        self.days: Dict[str, DayAggregate] = {}
+        self.merged: Dict[str, DayAggregate] = {}
+        self.merged_at: Optional[datetime] = None
+        self.version = 0
+        self._dirty = False
+
+    def record(self, username: str, endpoint_name: str, reached_model: bool):
+        day = datetime.now(timezone.utc).date().isoformat()
+        aggregate = self.days.get(day)
+        if aggregate is None:
+            aggregate = self.days[day] = DayAggregate()
+        aggregate.users.add(username)
+        if reached_model:
+            aggregate.interactions += 1
+            aggregate.endpoints[endpoint_name] = aggregate.endpoints.get(endpoint_name, 0) + 1
+        self._dirty = True
+
+    def _first_day(self) -> str:
+        return (datetime.now(timezone.utc).date() - timedelta(days=self.window_days)).isoformat()
+
+    async def checkpoint(self):
+        """Writes this process's counts if they changed and re-merges every checkpoint."""
+        first_day = self._first_day()
+        self.days = {day: aggregate for day, aggregate in self.days.items() if day >= first_day}
+        # Copied on the event loop, where record() runs, so the thread sees a stable view
+        days = {day: aggregate.model_copy(deep=True) for day, aggregate in self.days.items()} if self._dirty else None
+        self._dirty = False
+        try:
+            merged = await asyncio.to_thread(self._write_and_merge, days, first_day)
+        except OSError as e:
+            # Keep serving the last merge; the counts are written on the next try
+            log.error("live_metrics_checkpoint_failed", error=str(e))
+            self._dirty = self._dirty or days is not None
+            return
+        self.merged, self.merged_at = merged, datetime.now(timezone.utc)
+        self.version += 1
+
+    def _write_and_merge(self, days: Optional[Dict[str, DayAggregate]], first_day: str) -> Dict[str, DayAggregate]:
+        if self.directory is None:
+            return days if days is not None else dict(self.merged)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if days is not None:
+            temp_path = self.path.with_suffix(".tmp")
+            temp_path.write_text(json.dumps({day: aggregate.model_dump(mode="json") for day, aggregate in days.items()}))
+            os.replace(temp_path, self.path)
+
+        merged: Dict[str, DayAggregate] = {}
+        stale_before = time.time() - self.window_days * 86400
+        for path in self.directory.glob("live-*.json"):
+            try:
+                if path.stat().st_mtime < stale_before:
+                    # Left by a process that stopped more than a window ago
+                    path.unlink()
+                    continue
+                checkpoint = json.loads(path.read_text())
+            except (OSError, ValueError):
+                # Removed or being rewritten by another process; its counts return next time
+                continue
+            for day, data in checkpoint.items():
+                if day < first_day:
+                    continue
+                aggregate = DayAggregate(**data)
+                if day in merged:
+                    merged[day].merge(aggregate)
+                else:
+                    merged[day] = aggregate
+        return merged
+
+
+def blend_metrics(job_metrics: Optional[dict], live_days: Dict[str, DayAggregate], today: date, trend_days: int, generated_at: datetime) -> dict:
+    """
+    metrics.json, in the metrics job's schema, from the job's last output and
+    the live counts. Both undercount, the job by what happened since it ran and
+    the live counts by what happened before they were collected, so each trend
+    day takes the larger of the two. The total adds each day's live surplus;
+    endpoints add the live counts of days after the job's last day, since
+    metrics.json has no per-day endpoint breakdown.
+    """
+    first_day = (today - timedelta(days=trend_days)).isoformat()
+    job_trend: Dict[str, tuple] = {}
+    job_endpoints: Dict[str, int] = {}
+    job_total = 0
+    if job_metrics:
+        trend_data = job_metrics.get("trend_data", {})
+        job_trend = {
+            label: (users, interactions)
+            for label, users, interactions in zip(
+                trend_data.get("labels", []), trend_data.get("active_users", []), trend_data.get("interactions", [])
+            )
+        }
+        endpoint_data = job_metrics.get("endpoint_data", {})
+        job_endpoints = dict(zip(endpoint_data.get("labels", []), endpoint_data.get("interactions", [])))
+        job_total = job_metrics.get("total_interactions", 0)
+    job_last_day = max(job_trend, default="")
+
+    labels = sorted(day for day in set(job_trend) | set(live_days) if day >= first_day)
+    active_users, interactions = [], []
+    total_interactions = job_total
+    for day in labels:
+        job_users, job_interactions = job_trend.get(day, (0, 0))
+        live = live_days.get(day)
+        day_users = max(job_users, len(live.users) if live else 0)
+        day_interactions = max(job_interactions, live.interactions if live else 0)
+        active_users.append(day_users)
+        interactions.append(day_interactions)
+        total_interactions += day_interactions - job_interactions
+
+    endpoints = dict(job_endpoints)
+    for day, live in live_days.items():
+        if day > job_last_day:
+            for endpoint_name, count in live.endpoints.items():
+                endpoints[endpoint_name] = endpoints.get(endpoint_name, 0) + count
+    ranked = sorted(endpoints.items(), key=lambda item: item[1], reverse=True)
+
+    return {
+        "generated_at_utc": generated_at.replace(tzinfo=None).isoformat(),
+        "trend_data": {
+            "labels": labels,
+            "active_users": active_users,
+            "interactions": interactions,
+        },
+        "endpoint_data": {
+            "labels": [endpoint_name for endpoint_name, _ in ranked],
+            "interactions": [count for _, count in ranked],
+        },
+        "total_interactions": total_interactions,
+    }
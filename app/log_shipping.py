@@ -0,0 +1,147 @@
+"""
+Asynchronous log shipping. Request handlers only put log records on a bounded
+queue; a background thread shortens oversized fields, renders the records and
+hands them to the sinks (stdout, Google Cloud Logging, a local file) in
+batches. When the queue is full records are dropped and counted rather than
+making the request wait.
+"""
+
+import hashlib
+import logging
+import queue
+import threading
+from logging.handlers import QueueHandler
+from typing import Any, List
+
+import structlog
+
+from telemetry import LOG_FIELDS_SHORTENED, LOG_RECORDS_DROPPED
+
+log = structlog.get_logger()
+
+# Share of the queue INFO and DEBUG records may fill; the rest is kept for warnings and errors
+LOW_PRIORITY_SHARE = 0.9
+
+
+def shorten_fields(value: Any, max_chars: int, mode: str = "truncate") -> Any:
+    """
+    Returns value with every string longer than max_chars cut to max_chars
+    ("truncate") or replaced by its SHA-256 and length ("hash"). Dicts and lists
+    are copied, not modified, since the caller may still hold them.
+    """
+    if isinstance(value, str):
+        if len(value) <= max_chars:
+            return value
+        LOG_FIELDS_SHORTENED.labels(mode=mode).inc()
+        if mode == "hash":
+            return {"sha256": hashlib.sha256(value.encode("utf-8")).hexdigest(), "length": len(value)}
+        return f"{value[:max_chars]}...[{len(value) - max_chars} more chars]"
+    if isinstance(value, dict):
+        return {key: shorten_fields(item, max_chars, mode) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [shorten_fields(item, max_chars, mode) for item in value]
+    return value
+
+
+class BoundedQueueHandler(QueueHandler):
+    """
+    Enqueues records as they are, leaving formatting to the shipper thread, and
+    never blocks: a record that does not fit is dropped and counted.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.low_priority_limit = int(log_queue.maxsize * LOW_PRIORITY_SHARE)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        if record.levelno < logging.WARNING and self.queue.qsize() >= self.low_priority_limit:
+            self._drop(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self._drop(record)
+
+    def _drop(self, record: logging.LogRecord):
+        self.dropped += 1
+        LOG_RECORDS_DROPPED.labels(level=record.levelname.lower()).inc()
+
+
+class LogShipper:
+    """
+    Owns the log queue and the thread that drains it. Install `handler` on the
+    root logger; the sink handlers only ever run on the shipper thread.
+    """
+
+    def __init__(
+        self,
+        sinks: List[logging.Handler],
+        max_queue: int = 10_000,
+        batch_size: int = 500,
+        max_field_chars: int = 2000,
+        field_mode: str = "truncate",
+    ):
+        self.sinks = list(sinks)
+        self.batch_size = batch_size
+        self.max_field_chars = max_field_chars
+        self.field_mode = field_mode
+        self.queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self.handler = BoundedQueueHandler(self.queue)
+        self._reported_drops = 0
+        self._thread = threading.Thread(target=self._run, name="log-shipper", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def replace_sink(self, old: logging.Handler, new: logging.Handler):
+        # A new list rather than an in-place edit: the shipper thread may be iterating the old one
+        self.sinks = [new if sink is old else sink for sink in self.sinks]
+        old.close()
+
+    def flush(self, timeout: float) -> bool:
+        """Waits up to timeout seconds for the records queued so far to be shipped."""
+        shipped = threading.Event()
+        try:
+            self.queue.put(shipped, timeout=timeout)
+        except queue.Full:
+            return False
+        return shipped.wait(timeout)
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            flushes = [item for item in batch if isinstance(item, threading.Event)]
+            self._ship([item for item in batch if isinstance(item, logging.LogRecord)])
+            for shipped in flushes:
+                shipped.set()
+            dropped = self.handler.dropped
+            if dropped > self._reported_drops:
+                log.warning("log_records_dropped", dropped=dropped - self._reported_drops, dropped_total=dropped)
+                self._reported_drops = dropped
+
+    def _ship(self, records: List[logging.LogRecord]):
+        sinks = self.sinks
+        for record in records:
+            # structlog records carry their event dict as msg
+            if isinstance(record.msg, dict):
+                record.msg = shorten_fields(record.msg, self.max_field_chars, self.field_mode)
+            for sink in sinks:
+                if record.levelno >= sink.level:
+                    try:
+                        sink.handle(record)
+                    except Exception:
+                        sink.handleError(record)
+        for sink in sinks:
+            try:
+                sink.flush()
+            except Exception:
+                pass
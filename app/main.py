@@ -2,35 +2,79 @@
 
 import os
 import json
+import asyncio
 from dotenv import load_dotenv
-import csv
+import io
 from pathlib import Path
-from typing import List, Optional, Dict
+from typing import Callable, List, Optional, Dict, Tuple
 import time
 import logging
 import secrets
 from datetime import datetime
 import uuid
-import copy
+import hashlib
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from contextvars import ContextVar
 
+import jinja2
 import structlog
+from cachetools import LRUCache, TTLCache
+from markupsafe import Markup
 
-import google.cloud.logging 
-import vertexai
-from vertexai.generative_models import GenerativeModel
 from markdown_it import MarkdownIt
-from google.cloud import bigquery
-from google.cloud.logging.handlers import CloudLoggingHandler
 
 from fastapi import FastAPI, Request, Form, HTTPException, Response
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
-from starlette.middleware.base import BaseHTTPMiddleware
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
+from starlette.datastructures import MutableHeaders
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 
+from control_store import (
+    Control,
+    ControlDatabase,
+    ControlRepository,
+    JournaledControlStore,
+    Section,
+)
+from live_metrics import LiveMetrics, blend_metrics
+from log_shipping import LogShipper
+from shared_state import Change, SharedState
+from startup import LazyClient, Startup
+from user_store import (
+    BigQueryUserBackend,
+    CsvUserBackend,
+    User,
+    UserBackend,
+    UserRepository,
+    UserWrite,
+    UserWriteQueue,
+)
+from telemetry import (
+    AI_CACHE_LOOKUPS,
+    AI_ERRORS,
+    AI_INFLIGHT,
+    AI_REQUEST_DURATION,
+    BIGQUERY_CALL_DURATION,
+    CONTENT_TYPE_LATEST,
+    FRAGMENT_CACHE_LOOKUPS,
+    HTTP_REQUEST_DURATION,
+    metrics_payload,
+    route_label,
+)
+
 # --- logging configuration ---
 LOG_ENV = os.getenv("PY_ENV", "prod").lower()
+# Log records waiting to be shipped; beyond this they are dropped (and counted)
+LOG_QUEUE_MAX = int(os.getenv("LOG_QUEUE_MAX", "10000"))
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "500"))
+# Longer string fields (AI prompts and responses) are cut ("truncate") or hashed ("hash")
+LOG_FIELD_MAX_CHARS = int(os.getenv("LOG_FIELD_MAX_CHARS", "2000"))
+LOG_FIELD_MODE = os.getenv("LOG_FIELD_MODE", "truncate").lower()
+# Optional JSON-lines file that receives every shipped record, e.g. for offline tests
+LOG_FILE_PATH = os.getenv("LOG_FILE_PATH")
+# How long shutdown waits for queued log records to be shipped
+LOG_DRAIN_SECONDS = float(os.getenv("LOG_DRAIN_SECONDS", "5"))
 
 # 2. Define shared processors that PREPARE the log, but do not render it
 shared_processors = [
@@ -62,15 +106,31 @@ else:
     formatter = structlog.stdlib.ProcessorFormatter(
         processor=structlog.processors.JSONRenderer(),
     )
-    # And the handler is the Google Cloud Logging handler
-    handler = CloudLoggingHandler(google.cloud.logging.Client())
+    # JSON on stdout until startup swaps in the Google Cloud Logging handler
+    handler = logging.StreamHandler()
 
-# 5. Configure Python's root logger to use our new handler and formatter
+# 5. Ship logs from a background thread: the root logger only enqueues records,
+# the handlers (sinks) format and write them off the request path
 handler.setFormatter(formatter)
+log_sinks = [handler]
+if LOG_FILE_PATH:
+    file_handler = logging.FileHandler(LOG_FILE_PATH, encoding="utf-8")
+    file_handler.setFormatter(
+        structlog.stdlib.ProcessorFormatter(processor=structlog.processors.JSONRenderer())
+    )
+    log_sinks.append(file_handler)
+log_shipper = LogShipper(
+    log_sinks,
+    max_queue=LOG_QUEUE_MAX,
+    batch_size=LOG_BATCH_SIZE,
+    max_field_chars=LOG_FIELD_MAX_CHARS,
+    field_mode=LOG_FIELD_MODE,
+)
 root_logger = logging.getLogger()
 root_logger.handlers.clear() # Clear any existing handlers
-root_logger.addHandler(handler)
+root_logger.addHandler(log_shipper.handler)
 root_logger.setLevel(logging.INFO)
+log_shipper.start()
 
 # 6. Get a logger instance for the application to use
 log = structlog.get_logger()
@@ -79,10 +139,42 @@ log = structlog.get_logger()
 
 # --- FastAPI App Setup ---
 load_dotenv()
-app = FastAPI(docs_url=None, redoc_url=None, openapi_url=None)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await start_app()
+    yield
+    await stop_app()
+
+
+app = FastAPI(docs_url=None, redoc_url=None, openapi_url=None, lifespan=lifespan)
 APP_VERSION = "0.1"
 SECRET_KEY = os.getenv("SECRET_KEY")
 COOKIE_NAME = "auth_token_session"
+# Controls are persisted in SQLite ("sqlite", controls.csv seeds an empty database)
+# or in controls.csv as a snapshot plus an append-only journal ("journal")
+CONTROLS_STORE = os.getenv("CONTROLS_STORE", "sqlite").lower()
+CONTROLS_CSV_PATH = Path(__file__).parent / "controls.csv"
+CONTROLS_DB_PATH = Path(os.getenv("CONTROLS_DB_PATH", Path(__file__).parent / "controls.db"))
+CONTROLS_JOURNAL_PATH = Path(__file__).parent / "controls.journal"
+# Where the user directory is refreshed from: "bigquery", or "csv" (users.csv) for local development
+USER_BACKEND = os.getenv("USER_BACKEND", "bigquery").lower()
+USER_REFRESH_INTERVAL_SECONDS = float(os.getenv("USER_REFRESH_INTERVAL_SECONDS", "300"))
+# User writes waiting for the backend before add/delete start answering 503
+USER_WRITE_QUEUE_MAX = int(os.getenv("USER_WRITE_QUEUE_MAX", "1000"))
+USER_WRITE_MAX_ATTEMPTS = int(os.getenv("USER_WRITE_MAX_ATTEMPTS", "5"))
+# How long shutdown waits for queued user writes
+USER_WRITE_DRAIN_SECONDS = float(os.getenv("USER_WRITE_DRAIN_SECONDS", "20"))
+# Upper bound on how long a user write can stay unsettled; frees its token if the worker died
+USER_WRITE_CLAIM_SECONDS = float(os.getenv("USER_WRITE_CLAIM_SECONDS", "600"))
+# Local SQLite file through which gunicorn workers share user and catalog changes
+SHARED_STATE_PATH = Path(os.getenv("SHARED_STATE_PATH", Path(__file__).parent / "shared_state.db"))
+# Background journal compaction: how often to check, and how many records make it worthwhile
+JOURNAL_COMPACT_INTERVAL_SECONDS = float(os.getenv("JOURNAL_COMPACT_INTERVAL_SECONDS", "300"))
+JOURNAL_COMPACT_MIN_RECORDS = int(os.getenv("JOURNAL_COMPACT_MIN_RECORDS", "100"))
+# Number of controls rendered per page in the sidebar list and /search results
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "50"))
 
 md = MarkdownIt()
 
@@ -91,158 +183,872 @@ PROJECT_ID = "aicontrol-8c59b"  # Replace with your project ID
 LOCATION = "us-central1"
 MODEL_NAME = "gemini-2.0-flash-lite-001"
 # MODEL_NAME = "gemini-2.5-flash"
+# "vertex" calls Gemini; "fake" answers locally (see fake_model.py) for load tests and benchmarks
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "vertex").lower()
+if MODEL_BACKEND == "fake":
+    # Logged as ai_model_name, which keeps benchmark traffic out of the real model's numbers
+    MODEL_NAME = "fake-gemini"
+FAKE_MODEL_LATENCY_MS = float(os.getenv("FAKE_MODEL_LATENCY_MS", "800"))
+# Spread of the log-normal latency distribution around the median; 0 makes every call take the median
+FAKE_MODEL_LATENCY_SIGMA = float(os.getenv("FAKE_MODEL_LATENCY_SIGMA", "0.5"))
+FAKE_MODEL_ERROR_RATE = float(os.getenv("FAKE_MODEL_ERROR_RATE", "0"))
+FAKE_MODEL_STREAM_CHUNKS = int(os.getenv("FAKE_MODEL_STREAM_CHUNKS", "20"))
+FAKE_MODEL_RESPONSE_WORDS = int(os.getenv("FAKE_MODEL_RESPONSE_WORDS", "120"))
+FAKE_MODEL_SEED = int(os.getenv("FAKE_MODEL_SEED", "0"))
+
+# Upper bound on concurrent Gemini calls per worker, and per-call timeout (seconds)
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "8"))
+AI_TIMEOUT_SECONDS = float(os.getenv("AI_TIMEOUT_SECONDS", "30"))
+AI_SEMAPHORE = asyncio.Semaphore(AI_MAX_CONCURRENCY)
+# Stream /ai/chat and /ai/review-text responses token-by-token over SSE
+AI_STREAMING = os.getenv("AI_STREAMING", "true").lower() == "true"
+AI_STREAM_TTL_SECONDS = 60
+# Response cache for identical AI requests (LRU-evicted, entries expire after the TTL)
+AI_CACHE_MAX_ENTRIES = int(os.getenv("AI_CACHE_MAX_ENTRIES", "1024"))
+AI_CACHE_TTL_SECONDS = float(os.getenv("AI_CACHE_TTL_SECONDS", "3600"))
+# Rendered catalog fragments kept by the fragment cache (pages of /search, admin table)
+FRAGMENT_CACHE_MAX_ENTRIES = int(os.getenv("FRAGMENT_CACHE_MAX_ENTRIES", "256"))
+# /metrics is served to admins; scrapers send "Authorization: Bearer <METRICS_BEARER_TOKEN>".
+# METRICS_PUBLIC=true opens it to anyone, e.g. when only a private network can reach the app.
+METRICS_BEARER_TOKEN = os.getenv("METRICS_BEARER_TOKEN")
+METRICS_PUBLIC = os.getenv("METRICS_PUBLIC", "false").lower() == "true"
+
+USER_TABLE_ID = "aicontrol-8c59b.feedback.users"
+
+
+# --- Lazily created clients ---
+# The Google client libraries are imported inside the factories: importing them
+# is a large part of cold start, and a worker that never needs one skips it.
+def create_vertex_model():
+    import vertexai
+    from vertexai.generative_models import GenerativeModel
 
-try:
     vertexai.init(project=PROJECT_ID, location=LOCATION)
-    GEMINI_MODEL = GenerativeModel(MODEL_NAME)
-    print("Vertex AI and Gemini Model initialized successfully.")
-except Exception as e:
-    print(f"Error initializing Vertex AI: {e}. AI features will be disabled.")
-    GEMINI_MODEL = None
-
-
-# --- BigQuery Client Initialization ---
-try:
-    BQ_CLIENT = bigquery.Client()
-    USER_TABLE_ID = "aicontrol-8c59b.feedback.users"
-    print("BigQuery client initialized successfully.")
-except Exception as e:
-    print(f"Error initializing BigQuery client: {e}. User management will be disabled.")
-    BQ_CLIENT = None
+    return GenerativeModel(MODEL_NAME)
+
+
+def create_fake_model():
+    from fake_model import FakeGenerativeModel
+
+    return FakeGenerativeModel(
+        latency_ms=FAKE_MODEL_LATENCY_MS,
+        latency_sigma=FAKE_MODEL_LATENCY_SIGMA,
+        error_rate=FAKE_MODEL_ERROR_RATE,
+        stream_chunks=FAKE_MODEL_STREAM_CHUNKS,
+        response_words=FAKE_MODEL_RESPONSE_WORDS,
+        seed=FAKE_MODEL_SEED,
+    )
+
+
+# Anything with generate_content_async(prompt, stream=...) like GenerativeModel's
+MODEL_BACKENDS: Dict[str, Callable[[], object]] = {
+    "vertex": create_vertex_model,
+    "fake": create_fake_model,
+}
+
+
+def create_gemini_model():
+    factory = MODEL_BACKENDS.get(MODEL_BACKEND)
+    if factory is None:
+        raise ValueError(f"Unknown MODEL_BACKEND {MODEL_BACKEND!r}; expected one of {sorted(MODEL_BACKENDS)}")
+    return factory()
+
+
+def create_bigquery_client():
+    from google.cloud import bigquery
+
+    return bigquery.Client()
+
+
+startup = Startup()
+# A failed creation leaves the client None: AI features or user management are disabled
+gemini_model: LazyClient = startup.lazy(LazyClient("gemini", create_gemini_model))
+bq_client: LazyClient = startup.lazy(LazyClient("bigquery", create_bigquery_client))
 
 templates = Jinja2Templates(directory="templates")
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 
-# --- Pydantic model for a user ---
+# --- Data Model & Loading ---
+def open_user_backend() -> Optional[UserBackend]:
+    """Blocking: creates the BigQuery client for the bigquery backend."""
+    if USER_BACKEND == "csv":
+        return CsvUserBackend(Path(__file__).parent / "users.csv")
+    client = bq_client.get_sync()
+    if client:
+        return BigQueryUserBackend(client, USER_TABLE_ID)
+    return None
+
+
+# The backend is opened on startup
+user_repo = UserRepository(None)
+# Started on startup; None when there is no user backend to write to
+user_writes: Optional[UserWriteQueue] = None
+# --- Dictionary to hold users for fast lookups (owned by user_repo) ---
+users_by_token: Dict[str, User] = user_repo.users_by_token
+control_repo = ControlRepository()
+
+
+def user_backend_call(operation: str):
+    """Times user directory reads; only BigQuery reads feed the BigQuery metrics."""
+    return bigquery_call(operation) if USER_BACKEND == "bigquery" else nullcontext()
+
+
+def load_users():
+    """Opens the user backend and loads every user into users_by_token on startup."""
+    user_repo.backend = open_user_backend()
+    if user_repo.backend is None:
+        print("BigQuery client not available. Skipping user load.")
+        return
+    with user_backend_call("load_users"):
+        user_repo.apply(user_repo.fetch(full=True))
+    print(f"Loaded {len(user_repo)} users from the {USER_BACKEND} user backend")
+
+
+async def refresh_users(full: bool = False) -> tuple[int, int]:
+    """Syncs users_by_token with the backend off the event loop; returns (added, removed)."""
+    with user_backend_call("refresh_users"):
+        sync = await asyncio.to_thread(user_repo.fetch, full)
+    added, removed = user_repo.apply(sync)
+    log.info("users_refreshed", full=full, added=added, removed=removed, users=len(user_repo))
+    return added, removed
 
 
-# --- Data Model & Loading ---
-class User(BaseModel):
-    username: str
-    email: str
-    token: str
-    role: str
-    created_on: str
+def open_control_store():
+    if CONTROLS_STORE == "journal":
+        return JournaledControlStore(CONTROLS_CSV_PATH, CONTROLS_JOURNAL_PATH)
+    return ControlDatabase(CONTROLS_DB_PATH)
+
 
+def load_controls():
+    """Loads the control catalog from the control store, importing controls.csv on first start only."""
+    if not control_db.seeded():
+        try:
+            imported = control_db.import_csv(CONTROLS_CSV_PATH)
+            print(f"Imported {imported} controls from {CONTROLS_CSV_PATH.name}")
+        except FileNotFoundError:
+            print("Error: controls.csv not found. No controls will be loaded.")
+    control_repo.add_many(control_db.load_all())
+    print(f"Loaded {len(control_repo)} controls from the {CONTROLS_STORE} control store")
+
+
+# --- Cross-worker state sync ---
+def apply_control_change(change: Change):
+    if change.op == "delete":
+        control_repo.remove(change.key)
+    else:
+        control = Control(**change.payload)
+        if control.id in control_repo:
+            control_repo.update(
+                control.id,
+                {field: getattr(control, field) for field in Control.model_fields if field != "id"},
+            )
+        else:
+            control_repo.add(control)
+    invalidate_ai_cache(change.key)
 
-class Section(BaseModel):
-    id_slug: str
-    title: str
-    helper_text: str
-    placeholder: str
 
+def apply_user_change(change: Change):
+    if change.op == "delete":
+        user_repo.remove(change.key)
+    elif change.op == "upsert":
+        user_repo.upsert(User(**change.payload))
+    else:  # "settled": the backend write of an earlier change finished or gave up
+        user_repo.settle(UserWrite(**change.payload["write"]), change.payload["error"])
 
-class Control(BaseModel):
-    id: str
-    name: str
-    risk_id: Optional[str] = None
-    status: Optional[str] = None
-    owner: Optional[str] = None
-    risk_text: Optional[str] = None
-    description: str
-    sections: List[Section]
-    # Removed AI-related fields like 'suggestions' and 'assessment_document' for now
 
+def resync_controls():
+    """Rebuilds the catalog from the control store after falling too far behind the feed."""
+    stored = {control.id: control for control in control_db.load_all()}
+    for control in list(control_repo.all()):
+        if control.id not in stored:
+            control_repo.remove(control.id)
+            invalidate_ai_cache(control.id)
+    for control in stored.values():
+        apply_control_change(Change(seq=0, topic="control", key=control.id, op="upsert", payload=control.model_dump()))
 
-users_by_token: Dict[str, User] = {}
-controls: List[Control] = []
 
-# --- Dictionary to hold users for fast lookups ---
-users_by_token: Dict[str, User] = {}
+def resync_users():
+    """Rebuilds users_by_token from the user backend after falling too far behind the feed."""
+    if user_repo.backend is None:
+        return
+    with user_backend_call("resync_users"):
+        added, removed = user_repo.resync()
+    log.info("users_resynced", added=added, removed=removed, users=len(user_repo))
 
 
-def load_users_from_bq():
-    """Loads users from BigQuery into a dictionary keyed by token on startup."""
-    if not BQ_CLIENT:
-        print("BigQuery client not available. Skipping user load.")
+def sync_shared_state():
+    """
+    Applies the changes every worker (this one included) published since the last
+    call, in feed order. Cheap when nothing changed: one indexed SQLite read.
+    """
+    if shared_state is None:
+        return
+    changes = shared_state.poll()
+    if changes is None:
+        log.warning("shared_state_resync", revision=shared_state.revision)
+        resync_controls()
+        resync_users()
         return
+    for change in changes:
+        if change.topic == "control":
+            apply_control_change(change)
+        elif change.topic == "user":
+            apply_user_change(change)
+
 
-    query = f"SELECT username, email, token, role, created_on FROM `{USER_TABLE_ID}`"
+async def persist_control_change(control: Control, op: str, write):
+    """
+    Runs a control store write under the cross-worker write lock, publishes it and
+    applies it to this worker's catalog. Raises if the write fails.
+    """
+
+    def persist():
+        payload = control.model_dump() if op == "upsert" else None
+        with shared_state.publish("control", control.id, op, payload):
+            write()
+
+    await asyncio.to_thread(persist)
+    sync_shared_state()
+
+
+async def publish_user_change(user: User, op: str):
+    """
+    Applies a user change in every worker and queues its write to the user
+    backend. The change stays in effect unless the write finally fails.
+
+    Each worker has its own write queue, so two writes of one token queued in
+    different workers could reach the backend in either order. The change
+    therefore claims the token until its write settles, and a second change
+    to the same token is refused with HTTPException(409) meanwhile. Raises
+    HTTPException(503) when the write queue is full.
+    """
+    payload = user.model_dump() if op == "upsert" else None
+    claimed = await asyncio.to_thread(
+        shared_state.announce_claimed, "user", user.token, op, payload, USER_WRITE_CLAIM_SECONDS
+    )
+    if not claimed:
+        raise HTTPException(
+            status_code=409, detail="An earlier change to this user is still being saved; try again shortly."
+        )
+    sync_shared_state()
+    write = UserWrite(action="insert" if op == "upsert" else "delete", user=user)
     try:
-        query_job = BQ_CLIENT.query(query)
-        for row in query_job:
-            # Convert created_on from datetime to ISO string to match Pydantic model
-            user_data = dict(row)
-            user_data["created_on"] = user_data["created_on"].isoformat() + "Z"
-            user = User(**user_data)
-            users_by_token[user.token] = user
-        print(f"Loaded {len(users_by_token)} users from BigQuery table {USER_TABLE_ID}")
+        user_writes.submit(write)
+    except asyncio.QueueFull:
+        await settle_user_write(write, "User write queue is full.")
+        raise HTTPException(status_code=503, detail="Too many pending user changes; try again shortly.")
+
+
+async def settle_user_write(write: UserWrite, error: Optional[str]):
+    """Tells every worker a queued user write finished, undoing it there if it failed."""
+    if error:
+        log.error("user_write_failed", action=write.action, target_username=write.user.username, error=error)
+    payload = {"write": write.model_dump(), "error": error}
+    await asyncio.to_thread(shared_state.announce_released, "user", write.user.token, "settled", payload)
+    sync_shared_state()
+
+
+# --- Background tasks ---
+# Strong references so running tasks aren't garbage collected
+background_tasks: set = set()
+
+
+def start_background_task(coro):
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+
+async def compact_controls_journal():
+    if control_db.journal_records == 0:
+        return
+    start_time = time.time()
+    try:
+        records = control_db.journal_records
+        await asyncio.to_thread(control_db.compact)
+        log.info(
+            "controls_journal_compacted",
+            journal_records=records,
+            controls=control_db.count(),
+            duration_ms=round((time.time() - start_time) * 1000, 2),
+        )
     except Exception as e:
-        print(f"Error loading users from BigQuery: {e}")
+        log.error("controls_journal_compaction_failed", error=str(e))
+
+
+async def compact_controls_journal_periodically():
+    while True:
+        await asyncio.sleep(JOURNAL_COMPACT_INTERVAL_SECONDS)
+        if control_db.journal_records >= JOURNAL_COMPACT_MIN_RECORDS:
+            await compact_controls_journal()
+
+
+async def refresh_users_periodically():
+    while True:
+        await asyncio.sleep(USER_REFRESH_INTERVAL_SECONDS)
+        try:
+            await refresh_users()
+        except Exception as e:
+            log.error("users_refresh_failed", error=str(e))
+
+
+# --- Startup and shutdown ---
+# Assigned by their initializers during startup; None if that initializer failed
+shared_state: Optional[SharedState] = None
+control_db = None
+
+
+def open_shared_state():
+    global shared_state
+    shared_state = SharedState(SHARED_STATE_PATH)
+
+
+def load_control_store():
+    global control_db
+    control_db = open_control_store()
+    load_controls()
+
+
+def attach_cloud_logging():
+    """Sends logs to Google Cloud Logging instead of stdout (production only)."""
+    import google.cloud.logging
+    from google.cloud.logging.handlers import CloudLoggingHandler
+
+    cloud_handler = CloudLoggingHandler(google.cloud.logging.Client())
+    cloud_handler.setFormatter(formatter)
+    log_shipper.replace_sink(handler, cloud_handler)
+
+
+# The shared state is opened first so that changes other workers publish while
+# the controls and users load are replayed instead of lost. Everything else is
+# independent and runs concurrently; Gemini and BigQuery (for anything but the
+# user load) are created on first use.
+startup.add("shared_state", open_shared_state)
+startup.add("controls", load_control_store, depends_on=["shared_state"])
+startup.add("users", load_users, depends_on=["shared_state"])
+if LOG_ENV != "development":
+    startup.add("cloud_logging", attach_cloud_logging, critical=False)
+
+
+async def start_app():
+    global user_writes
+    for task in await startup.run():
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+    if not startup.ready:
+        return
+    if user_repo.backend is not None:
+        user_writes = UserWriteQueue(
+            user_repo.backend,
+            settle_user_write,
+            max_pending=USER_WRITE_QUEUE_MAX,
+            max_attempts=USER_WRITE_MAX_ATTEMPTS,
+            call_context=user_backend_call,
+        )
+        start_background_task(user_writes.run())
+        start_background_task(refresh_users_periodically())
+    if CONTROLS_STORE == "journal":
+        start_background_task(compact_controls_journal_periodically())
+    start_background_task(checkpoint_live_metrics_periodically())
+
+
+async def stop_app():
+    if user_writes is not None and len(user_writes) > 0:
+        try:
+            await user_writes.drain(USER_WRITE_DRAIN_SECONDS)
+        except asyncio.TimeoutError:
+            log.error("user_writes_not_flushed", pending=len(user_writes))
+    if CONTROLS_STORE == "journal" and control_db is not None:
+        await compact_controls_journal()
+    await live_metrics.checkpoint()
+    if not await asyncio.to_thread(log_shipper.flush, LOG_DRAIN_SECONDS):
+        print("Log records were still queued at shutdown.")
+
+
+# --- Middleware for Authentication and Timing ---
+# Paths served without a session cookie
+PUBLIC_PATHS = {"/login", "/favicon.ico", "/ready"} | ({"/metrics"} if METRICS_PUBLIC else set())
+
+
+def has_metrics_bearer_token(authorization: Optional[str]) -> bool:
+    return bool(METRICS_BEARER_TOKEN) and secrets.compare_digest(
+        authorization or "", f"Bearer {METRICS_BEARER_TOKEN}"
+    )
+
+
+class RequestTiming:
+    """
+    Per-request timing context, created by TimingMiddleware and shared with the rest of
+    the stack through scope["state"]["timing"] and the current_timing context variable.
+    Phases (ai, prompt, guidance, md, render, bq) accumulate milliseconds and are
+    reported in the Server-Timing header and the 'request_timing' log event.
+    """
+
+    __slots__ = ("start_time", "_start_perf", "phases")
+
+    def __init__(self):
+        self.start_time = time.time()
+        self._start_perf = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self._start_perf) * 1000
+
+    def add(self, phase: str, duration_ms: float):
+        self.phases[phase] = self.phases.get(phase, 0.0) + duration_ms
+
+    def server_timing_header(self) -> str:
+        metrics = [f"{phase};dur={duration_ms:.1f}" for phase, duration_ms in self.phases.items()]
+        metrics.append(f"app;dur={self.elapsed_ms():.1f}")
+        return ", ".join(metrics)
+
+    def log_fields(self) -> dict:
+        return {
+            "duration_ms": round(self.elapsed_ms(), 2),
+            "phases_ms": {phase: round(duration_ms, 2) for phase, duration_ms in self.phases.items()},
+        }
 
 
-def load_controls_from_csv():
-    """Loads and parses control data, including the dynamic sections."""
+current_timing: ContextVar[Optional[RequestTiming]] = ContextVar("current_timing", default=None)
+
+
+def ms_since(start: float) -> float:
+    """Milliseconds elapsed since a time.perf_counter() reading."""
+    return (time.perf_counter() - start) * 1000
+
+
+def record_phase(phase: str, duration_ms: float):
+    """Adds time spent in a phase to the current request's timing, if there is one."""
+    timing = current_timing.get()
+    if timing is not None:
+        timing.add(phase, duration_ms)
+
+
+@contextmanager
+def timed(phase: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(phase, ms_since(start))
+
+
+@contextmanager
+def bigquery_call(operation: str):
+    """Times a BigQuery call as the request's 'bq' phase and in the BigQuery histogram."""
+    start = time.perf_counter()
     try:
-        with open("controls.csv", mode="r", encoding="utf-8") as infile:
-            reader = csv.DictReader(infile)
-            for row in reader:
-                # Parse the JSON string from the 'sections' column
-                if "sections" in row and row["sections"]:
-                    row["sections"] = json.loads(row["sections"])
-                else:
-                    row["sections"] = (
-                        []
-                    )  # Default to an empty list if column is missing/empty
-                controls.append(Control(**row))
-        print(f"Loaded {len(controls)} controls from controls.csv")
-    except FileNotFoundError:
-        print("Error: controls.csv not found. No controls will be loaded.")
-
-
-# Load data on startup
-load_controls_from_csv()
-load_users_from_bq()
-
-
-# --- Middleware for Authentication ---
-class AuthMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        if request.url.path in [
-            "/login",
-            "/favicon.ico",
-        ] or request.url.path.startswith("/static"):
-            return await call_next(request)
+        yield
+    finally:
+        duration_ms = ms_since(start)
+        record_phase("bq", duration_ms)
+        BIGQUERY_CALL_DURATION.labels(operation=operation).observe(duration_ms / 1000)
+
+
+class TimedTemplate(jinja2.Template):
+    """Records every top-level template render, TemplateResponse included, as 'render'."""
+
+    def render(self, *args, **kwargs):
+        with timed("render"):
+            return super().render(*args, **kwargs)
+
+
+templates.env.template_class = TimedTemplate
+
+
+def render_markdown(text: str) -> str:
+    with timed("md"):
+        return md.render(text)
+
+
+class AuthMiddleware:
+    """Pure ASGI: resolves the session cookie to request.state.user or answers with the login dialog."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        path = scope["path"]
+        if path.startswith("/static"):
+            await self.app(scope, receive, send)
+            return
+        request = Request(scope)
+        if path in PUBLIC_PATHS or (
+            path == "/metrics" and has_metrics_bearer_token(request.headers.get("authorization"))
+        ):
+            await self.app(scope, receive, send)
+            return
+        if not startup.ready:
+            # A critical initializer failed; /ready reports which one
+            response = HTMLResponse("Service unavailable.", status_code=503)
+            await response(scope, receive, send)
+            return
+        # Pick up users and controls changed by other workers before using them
+        sync_shared_state()
         token_in_cookie = request.cookies.get(COOKIE_NAME)
         if token_in_cookie and token_in_cookie in users_by_token:
             # This is the key change: we attach the *entire* user object.
             request.state.user = users_by_token[token_in_cookie]
-            return await call_next(request)
-        return templates.TemplateResponse(
+            await self.app(scope, receive, send)
+            return
+        response = templates.TemplateResponse(
             "login_dialog.html", {"request": request, "error": None}
         )
+        await response(scope, receive, send)
+
+
+class TimingMiddleware:
+    """Pure ASGI: starts the request's timing context and adds a Server-Timing header."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timing = RequestTiming()
+        state = scope.setdefault("state", {})
+        state["timing"] = timing
+        state["start_time"] = timing.start_time
+        current_timing.set(timing)
+        status_code = None
+
+        async def send_with_server_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", timing.server_timing_header())
+            await send(message)
+
+        await self.app(scope, receive, send_with_server_timing)
+        HTTP_REQUEST_DURATION.labels(
+            method=scope["method"], route=route_label(scope), status=str(status_code)
+        ).observe(timing.elapsed_ms() / 1000)
+        # Streamed responses keep recording phases after the header went out,
+        # so the log event carries the complete breakdown
+        if timing.phases:
+            log.info(
+                "request_timing",
+                method=scope["method"],
+                path=scope["path"],
+                status_code=status_code,
+                **timing.log_fields(),
+            )
 
 
-class TimingMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        request.state.start_time = time.time()
-        response = await call_next(request)
-        return response
-
-
+# Added last so it runs first: authentication failures are timed too
 app.add_middleware(AuthMiddleware)
 app.add_middleware(TimingMiddleware)
 
 
-def load_best_practices(control_id: str) -> tuple[str, int]:
-    """Loads best practice content and counts the items for a specific control."""
-    try:
-        guidance_path = Path(f"guidance/{control_id}.md")
-        content = guidance_path.read_text()
+# --- Guidance (best practices) store ---
+GUIDANCE_DIR = Path("guidance")
+# How long a loaded (or missing) guidance file is trusted before its mtime is checked again
+GUIDANCE_RECHECK_SECONDS = float(os.getenv("GUIDANCE_RECHECK_SECONDS", "5"))
+
+
+def content_version(content: str) -> str:
+    """Short, stable hash of a piece of text, used to version cache keys."""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+
+
+class Guidance(BaseModel):
+    content: str = ""
+    practice_count: int = 0
+    version: str = ""
+    mtime_ns: Optional[int] = None  # None marks a negative entry (no guidance file)
+    checked_at: float = 0.0
+
+
+class GuidanceStore:
+    """
+    In-memory cache of the parsed guidance/{control_id}.md files. Entries, including
+    negative ones for controls without a file, are re-validated against the file's
+    mtime at most once every GUIDANCE_RECHECK_SECONDS.
+    """
+
+    def __init__(self, directory: Path, recheck_seconds: float):
+        self.directory = directory
+        self.recheck_seconds = recheck_seconds
+        self._entries: Dict[str, Guidance] = {}
+
+    def preload(self):
+        """Parses every guidance file up front so the first requests don't hit the disk."""
+        if not self.directory.is_dir():
+            return
+        for guidance_path in self.directory.glob("*.md"):
+            self.get(guidance_path.stem)
+        print(f"Loaded guidance for {len(self._entries)} controls from {self.directory}/")
+
+    def get(self, control_id: str) -> Guidance:
+        now = time.monotonic()
+        entry = self._entries.get(control_id)
+        if entry and now - entry.checked_at < self.recheck_seconds:
+            return entry
+
+        guidance_path = self.directory / f"{control_id}.md"
+        try:
+            # Control ids come from form data; never let one escape the guidance directory
+            if Path(control_id).name != control_id:
+                raise FileNotFoundError(control_id)
+            mtime_ns = guidance_path.stat().st_mtime_ns
+        except (FileNotFoundError, NotADirectoryError):
+            mtime_ns = None
+
+        if entry and entry.mtime_ns == mtime_ns:
+            entry.checked_at = now
+            return entry
+
+        entry = self._load(guidance_path, mtime_ns)
+        entry.checked_at = now
+        self._entries[control_id] = entry
+        return entry
+
+    def _load(self, guidance_path: Path, mtime_ns: Optional[int]) -> Guidance:
+        if mtime_ns is None:
+            return Guidance(version=content_version(""))
+        try:
+            content = guidance_path.read_text()
+        except FileNotFoundError:
+            # Deleted between stat() and read(); treat as missing until the next check
+            return Guidance(version=content_version(""))
         # Count lines starting with '*' or '-' as a simple heuristic for number of practices
         practice_count = sum(
             1 for line in content.splitlines() if line.strip().startswith(("*", "-"))
         )
-        return content, practice_count
-    except FileNotFoundError:
-        # If no specific guidance exists, return empty values gracefully
-        return "", 0
+        return Guidance(
+            content=content,
+            practice_count=practice_count,
+            version=content_version(content),
+            mtime_ns=mtime_ns,
+        )
+
+
+guidance_store = GuidanceStore(GUIDANCE_DIR, GUIDANCE_RECHECK_SECONDS)
+guidance_store.preload()
+
+
+def load_best_practices(control_id: str) -> tuple[str, int, str]:
+    """Returns the best practice content, its item count and its version for a control."""
+    with timed("guidance"):
+        guidance = guidance_store.get(control_id)
+    return guidance.content, guidance.practice_count, guidance.version
+
+
+# --- Fragment render cache ---
+class FragmentCache:
+    """
+    Rendered HTML of templates that depend only on the control catalog, keyed on the
+    template, a caller-supplied key and control_repo.version. Any add, update or
+    delete bumps the version, so a stale fragment is never served; the old entries
+    are dropped on the next lookup.
+    """
+
+    def __init__(self, repository: ControlRepository, max_entries: int):
+        self.repository = repository
+        self._entries = LRUCache(maxsize=max_entries)
+        self._version = repository.version
+
+    def render(self, template_name: str, key: tuple, build_context: Callable[[], dict]) -> Markup:
+        """Returns the cached fragment, rendering it with build_context() on a miss."""
+        if self._version != self.repository.version:
+            self._entries.clear()
+            self._version = self.repository.version
+        cache_key = (template_name, key)
+        html = self._entries.get(cache_key)
+        if html is not None:
+            FRAGMENT_CACHE_LOOKUPS.labels(template=template_name, result="hit").inc()
+            return html
+        FRAGMENT_CACHE_LOOKUPS.labels(template=template_name, result="miss").inc()
+        html = Markup(templates.get_template(template_name).render(build_context()))
+        self._entries[cache_key] = html
+        return html
+
+
+fragment_cache = FragmentCache(control_repo, FRAGMENT_CACHE_MAX_ENTRIES)
+
+
+def render_control_list(query: str, page: int) -> Markup:
+    """One page of the control list (search results, or the catalog for an empty query)."""
+
+    def build_context():
+        results = control_repo.search(query, page=page, page_size=SEARCH_PAGE_SIZE)
+        return {"controls": results.controls, "next_page": results.next_page}
+
+    # Search is case-insensitive, so the query's case doesn't need its own entry
+    return fragment_cache.render("partials/control_list.html", (query.lower(), page), build_context)
+
+
+# --- Conditional GET (ETag / If-None-Match) ---
+# Cache-Control for per-user pages: browsers may keep them but must revalidate every time
+REVALIDATE_CACHE_CONTROL = "private, no-cache"
+# /api/metrics changes at most once per live metrics checkpoint; dashboards can reuse it for a minute
+METRICS_CACHE_CONTROL = "private, max-age=60"
+
+
+def templates_version() -> str:
+    """Hash of every template, so ETags change when a deploy changes the markup."""
+    digest = hashlib.sha256()
+    for template_path in sorted(Path("templates").rglob("*.html")):
+        digest.update(template_path.as_posix().encode("utf-8"))
+        digest.update(template_path.read_bytes())
+    return digest.hexdigest()[:16]
+
+
+TEMPLATES_VERSION = templates_version()
+
+
+def make_etag(*parts) -> str:
+    """
+    Strong ETag over the versions a response is built from. Catalog-dependent tags
+    use shared_state.revision, which (unlike control_repo.version) is the same in
+    every worker holding the same catalog.
+    """
+    return '"' + content_version("|".join(str(part) for part in (TEMPLATES_VERSION, *parts))) + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = {candidate.strip() for candidate in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+def not_modified(etag: str, cache_control: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+
+
+def with_cache_headers(response: Response, etag: str, cache_control: str) -> Response:
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control
+    return response
+
+
+# --- Metrics file (metrics.json written by the metrics job) ---
+# The mount path for the bucket inside the Cloud Run container
+METRICS_FILE_PATH = Path(os.getenv("METRICS_FILE_PATH", "/mnt/gcs/metrics.json"))
+# How long the in-memory copy is served before the file is stat()ed again
+METRICS_RECHECK_SECONDS = float(os.getenv("METRICS_RECHECK_SECONDS", "30"))
+
+
+class MetricsSnapshot(BaseModel):
+    body: bytes  # pre-serialized JSON
+    etag: str
+    mtime_ns: int
+    size: int
+
+
+class MetricsFileReader:
+    """
+    Last good copy of metrics.json. The file sits on a GCS FUSE mount where every
+    stat and read is a network round trip, so it is only checked once every
+    recheck_seconds, in a worker thread, and re-read only when its mtime or size
+    changed. Requests keep getting the previous copy while a check runs, and a
+    read that fails or catches the file mid-write leaves that copy in place.
+    """
+
+    def __init__(self, path: Path, recheck_seconds: float):
+        self.path = path
+        self.recheck_seconds = recheck_seconds
+        self._snapshot: Optional[MetricsSnapshot] = None
+        self._error = "Metrics file not found. The job may not have run yet."
+        self._checked_at = float("-inf")
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    async def get(self) -> Tuple[Optional[MetricsSnapshot], str]:
+        """Returns the current snapshot (None until a first good read) and the last error."""
+        if time.monotonic() - self._checked_at >= self.recheck_seconds:
+            if self._refresh_task is None:
+                self._refresh_task = asyncio.create_task(self._refresh())
+            if self._snapshot is None:
+                # Nothing to serve yet: wait for the first read (shielded, it is shared)
+                await asyncio.shield(self._refresh_task)
+        return self._snapshot, self._error
+
+    async def _refresh(self):
+        try:
+            await asyncio.to_thread(self._reload_if_changed)
+        except Exception as e:
+            log.error("metrics_read_failed", error=str(e))
+        finally:
+            self._checked_at = time.monotonic()
+            self._refresh_task = None
+
+    def _reload_if_changed(self):
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            return
+        current = self._snapshot
+        if current and (stat.st_mtime_ns, stat.st_size) == (current.mtime_ns, current.size):
+            return
+        try:
+            raw = self.path.read_bytes()
+            data = json.loads(raw)
+        except (OSError, ValueError) as e:
+            log.error("metrics_read_failed", error=str(e))
+            self._error = f"Failed to read or parse metrics file: {e}"
+            return
+        if self.path.stat().st_mtime_ns != stat.st_mtime_ns:
+            # Rewritten while we were reading; pick it up on the next check
+            return
+        body = json.dumps(data).encode("utf-8")
+        self._snapshot = MetricsSnapshot(
+            body=body,
+            etag=make_etag("metrics", content_version(body.decode("utf-8"))),
+            mtime_ns=stat.st_mtime_ns,
+            size=stat.st_size,
+        )
+        log.info("metrics_file_loaded", size=stat.st_size)
+
+
+metrics_reader = MetricsFileReader(METRICS_FILE_PATH, METRICS_RECHECK_SECONDS)
+
+
+# --- Live metrics (counted in process, merged across workers) ---
+# Shared by every worker and instance: by default next to metrics.json on the bucket mount
+LIVE_METRICS_DIR = Path(os.getenv("LIVE_METRICS_DIR", METRICS_FILE_PATH.parent / "live_metrics"))
+LIVE_METRICS_CHECKPOINT_SECONDS = float(os.getenv("LIVE_METRICS_CHECKPOINT_SECONDS", "30"))
+# Days of live counts kept; matches the metrics job's trend window
+LIVE_METRICS_DAYS = 30
+
+live_metrics = LiveMetrics(LIVE_METRICS_DIR, LIVE_METRICS_DAYS)
+# (metrics.json ETag, live_metrics.version, day) -> served body and its ETag
+blended_metrics: Dict[tuple, Tuple[bytes, str]] = {}
+
+
+def current_metrics_body(snapshot: Optional[MetricsSnapshot]) -> Tuple[bytes, str]:
+    """metrics.json blended with the live counts, rebuilt only when either changed."""
+    today = datetime.utcnow().date()
+    key = (snapshot.etag if snapshot else None, live_metrics.version, today)
+    if key not in blended_metrics:
+        job_metrics = json.loads(snapshot.body) if snapshot else None
+        document = blend_metrics(
+            job_metrics, live_metrics.merged, today, LIVE_METRICS_DAYS, live_metrics.merged_at or datetime.utcnow()
+        )
+        body = json.dumps(document).encode("utf-8")
+        blended_metrics.clear()
+        blended_metrics[key] = (body, make_etag("metrics", content_version(body.decode("utf-8"))))
+    return blended_metrics[key]
+
+
+async def checkpoint_live_metrics_periodically():
+    while True:
+        await live_metrics.checkpoint()
+        await asyncio.sleep(LIVE_METRICS_CHECKPOINT_SECONDS)
 
 
 # --- Helper Function to find a control ---
 def find_control_by_id(control_id: str) -> Optional[Control]:
-    return next((c for c in controls if c.id == control_id), None)
+    return control_repo.get(control_id)
 
 
 # --- Login Endpoint ---
@@ -259,6 +1065,169 @@ async def login(request: Request, token: str = Form(...)):
         )
 
 
+# --- Non-blocking Gemini call ---
+async def _generate_content(prompt: str) -> str:
+    # Hold a semaphore slot for the duration of the upstream call so that a burst
+    # of AI requests queues here instead of piling onto Vertex AI.
+    model = await gemini_model.get()
+    async with AI_SEMAPHORE:
+        with AI_INFLIGHT.track_inprogress():
+            response = await model.generate_content_async(prompt)
+    return response.text.strip()
+
+
+async def generate_ai_text(prompt: str) -> str:
+    """
+    Calls Gemini through the async Vertex AI API so the event loop keeps serving
+    other requests. Raises asyncio.TimeoutError if the call (including time spent
+    waiting for a free slot) exceeds AI_TIMEOUT_SECONDS.
+    """
+    return await asyncio.wait_for(_generate_content(prompt), timeout=AI_TIMEOUT_SECONDS)
+
+
+# --- AI Response Cache ---
+ai_response_cache: TTLCache = TTLCache(
+    maxsize=AI_CACHE_MAX_ENTRIES, ttl=AI_CACHE_TTL_SECONDS
+)
+ai_cache_stats = {"hits": 0, "misses": 0}
+
+
+def ai_cache_key(
+    prompt_template_id: str,
+    user_input_text: str,
+    control_id: Optional[str] = None,
+    section_name: Optional[str] = None,
+    guidance_version: Optional[str] = None,
+) -> tuple:
+    """Builds the cache key; whitespace-only edits to the user's text still hit."""
+    normalized_text = " ".join(user_input_text.split())
+    return (
+        prompt_template_id,
+        MODEL_NAME,
+        control_id,
+        section_name,
+        content_version(normalized_text),
+        guidance_version,
+    )
+
+
+def lookup_ai_cache(cache_key: tuple) -> Optional[str]:
+    """Returns the cached response for a key (or None) and updates hit/miss counters."""
+    cached_text = ai_response_cache.get(cache_key)
+    if cached_text is None:
+        ai_cache_stats["misses"] += 1
+        AI_CACHE_LOOKUPS.labels(result="miss").inc()
+    else:
+        ai_cache_stats["hits"] += 1
+        AI_CACHE_LOOKUPS.labels(result="hit").inc()
+    return cached_text
+
+
+def ai_cache_log_fields() -> dict:
+    return {
+        "cache_hits": ai_cache_stats["hits"],
+        "cache_misses": ai_cache_stats["misses"],
+        "cache_size": len(ai_response_cache),
+    }
+
+
+def invalidate_ai_cache(control_id: str):
+    """Drops cached responses for a control whose name or description changed."""
+    for cache_key in [k for k in list(ai_response_cache.keys()) if k[2] == control_id]:
+        ai_response_cache.pop(cache_key, None)
+
+
+# --- Single-flight for identical in-flight AI calls ---
+# Maps an AI cache key to the upstream call currently answering it, so that
+# concurrent identical requests share one Gemini call instead of each sending one.
+ai_inflight_calls: Dict[tuple, Tuple[str, asyncio.Task]] = {}
+
+
+def join_inflight_ai_call(cache_key: tuple, prompt: str) -> Tuple[str, asyncio.Task, bool]:
+    """
+    Returns (upstream_call_id, task, coalesced) for the upstream call answering
+    cache_key, starting a new one if none is in flight.
+    """
+    inflight = ai_inflight_calls.get(cache_key)
+    if inflight:
+        upstream_call_id, task = inflight
+        return upstream_call_id, task, True
+
+    upstream_call_id = str(uuid.uuid4())
+    task = asyncio.ensure_future(generate_ai_text(prompt))
+    ai_inflight_calls[cache_key] = (upstream_call_id, task)
+
+    def _forget(done_task: asyncio.Task):
+        ai_inflight_calls.pop(cache_key, None)
+        # Mark the exception as retrieved even if every waiter has already timed out
+        if not done_task.cancelled():
+            done_task.exception()
+
+    task.add_done_callback(_forget)
+    return upstream_call_id, task, False
+
+
+class SharedAIStream:
+    """
+    One upstream streamed completion fanned out to every request waiting for
+    it. Chunks are kept, so a request that joins late first gets what has
+    already arrived; the upstream stream runs to the end even if the request
+    that started it goes away.
+    """
+
+    def __init__(self, prompt: str):
+        self.upstream_call_id = str(uuid.uuid4())
+        self.chunks: List[str] = []
+        self.error: Optional[Exception] = None
+        self.done = False
+        self._changed = asyncio.Condition()
+        self.task = asyncio.ensure_future(self._run(prompt))
+
+    async def _run(self, prompt: str):
+        try:
+            async for chunk_text in stream_ai_text(prompt):
+                async with self._changed:
+                    self.chunks.append(chunk_text)
+                    self._changed.notify_all()
+        except Exception as e:
+            self.error = e
+        finally:
+            async with self._changed:
+                self.done = True
+                self._changed.notify_all()
+
+    async def subscribe(self):
+        """Yields every chunk from the first, then raises the upstream error, if any."""
+        sent = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: len(self.chunks) > sent or self.done)
+                new_chunks = self.chunks[sent:]
+                done = self.done
+            for chunk_text in new_chunks:
+                yield chunk_text
+            sent += len(new_chunks)
+            if done:
+                if self.error is not None:
+                    raise self.error
+                return
+
+
+# Same keys as ai_inflight_calls, for streamed responses
+ai_inflight_streams: Dict[tuple, SharedAIStream] = {}
+
+
+def join_inflight_ai_stream(cache_key: tuple, prompt: str) -> Tuple[SharedAIStream, bool]:
+    """Returns (stream, coalesced) for the upstream stream answering cache_key, starting one if none is in flight."""
+    shared = ai_inflight_streams.get(cache_key)
+    if shared:
+        return shared, True
+
+    shared = ai_inflight_streams[cache_key] = SharedAIStream(prompt)
+    shared.task.add_done_callback(lambda _: ai_inflight_streams.pop(cache_key, None))
+    return shared, False
+
+
 # --- Central AI Calling and Logging Function (updated for structlog) ---
 async def call_ai_and_log(
     request: Request,
@@ -267,16 +1236,45 @@ async def call_ai_and_log(
     user_input_text: str,  # <-- CHANGE 1: Add new parameter
     control_id: Optional[str] = None,
     section_name: Optional[str] = None,
+    guidance_version: Optional[str] = None,
 ):
     """
     A central function to call the Gemini API and log structured events using structlog.
+    Identical requests are answered from ai_response_cache and logged as
+    'ai_cache_hit' instead of 'ai_response_received'. Identical requests that are
+    already in flight share one upstream call; every caller still logs its own
+    interaction_id, linked to the shared call through upstream_call_id.
     """
     interaction_id = str(uuid.uuid4())
     user = getattr(request.state, "user", None)
 
+    cache_key = ai_cache_key(
+        prompt_template_id, user_input_text, control_id, section_name, guidance_version
+    )
+    cached_text = lookup_ai_cache(cache_key)
+    if cached_text is not None:
+        live_metrics.record(user.username if user else "anonymous", request.scope["endpoint"].__name__, False)
+        log.info(
+            "ai_cache_hit",
+            interaction_id=interaction_id,
+            endpoint_name=request.scope["endpoint"].__name__,
+            username=user.username if user else "anonymous",
+            control_id=control_id,
+            section_name=section_name,
+            prompt_template_id=prompt_template_id,
+            ai_model_name=MODEL_NAME,
+            **ai_cache_log_fields(),
+        )
+        return cached_text
+
+    upstream_call_id, upstream_task, coalesced = join_inflight_ai_call(cache_key, prompt)
+    live_metrics.record(user.username if user else "anonymous", request.scope["endpoint"].__name__, True)
+
     log.info(
         "ai_request_sent",
         interaction_id=interaction_id,
+        upstream_call_id=upstream_call_id,
+        coalesced=coalesced,
         endpoint_name=request.scope["endpoint"].__name__,
         username=user.username if user else "anonymous",
         control_id=control_id,
@@ -288,17 +1286,24 @@ async def call_ai_and_log(
             "prompt_length": len(prompt),
             "user_input_text": user_input_text,
         },
+        **ai_cache_log_fields(),
     )
 
-    # ... (The rest of the function remains exactly the same) ...
     start_time = time.time()
     try:
-        response = GEMINI_MODEL.generate_content(prompt)
-        ai_response_text = response.text.strip()
+        # shield() so that one caller timing out or disconnecting doesn't cancel
+        # the upstream call for the others sharing it
+        ai_response_text = await asyncio.wait_for(
+            asyncio.shield(upstream_task), timeout=AI_TIMEOUT_SECONDS
+        )
+        ai_response_cache[cache_key] = ai_response_text
         latency_ms = (time.time() - start_time) * 1000
+        observe_ai_call(prompt_template_id, latency_ms, streamed=False, failed=False)
         log.info(
             "ai_response_received",
             interaction_id=interaction_id,
+            upstream_call_id=upstream_call_id,
+            coalesced=coalesced,
             username=user.username if user else "anonymous",
             response_latency_ms=round(latency_ms, 2),
             response_payload={"response_text": ai_response_text},
@@ -306,9 +1311,14 @@ async def call_ai_and_log(
         return ai_response_text
     except Exception as e:
         latency_ms = (time.time() - start_time) * 1000
+        observe_ai_call(prompt_template_id, latency_ms, streamed=False, failed=True)
+        if isinstance(e, asyncio.TimeoutError):
+            e = f"AI call timed out after {AI_TIMEOUT_SECONDS:g}s"
         log.error(
             "ai_call_failed",
             interaction_id=interaction_id,
+            upstream_call_id=upstream_call_id,
+            coalesced=coalesced,
             username=user.username if user else "anonymous",
             response_latency_ms=round(latency_ms, 2),
             error_message=str(e),
@@ -316,42 +1326,235 @@ async def call_ai_and_log(
         return f"Error: Could not process request. Details: {e}"
 
 
+def observe_ai_call(prompt_template_id: str, latency_ms: float, streamed: bool, failed: bool):
+    record_phase("ai", latency_ms)
+    AI_REQUEST_DURATION.labels(
+        prompt_template_id=prompt_template_id, streamed=str(streamed).lower()
+    ).observe(latency_ms / 1000)
+    if failed:
+        AI_ERRORS.labels(prompt_template_id=prompt_template_id).inc()
+
+
+# --- Streaming AI Responses (SSE) ---
+# Prompts registered by the HTMX POST endpoints, waiting for the browser's
+# EventSource to connect to /ai/stream/{stream_id}. Kept as one-shot handoffs in
+# the shared state, since the EventSource may reach a different worker.
+
+
+async def register_ai_stream(request: Request, **stream_context) -> str:
+    """Stores everything needed to run an AI call later and returns its stream URL."""
+    stream_id = str(uuid.uuid4())
+    user = getattr(request.state, "user", None)
+    pending = {
+        "start_time": request.state.start_time,
+        "username": user.username if user else None,
+        "endpoint_name": request.scope["endpoint"].__name__,
+        **stream_context,
+    }
+    await asyncio.to_thread(
+        shared_state.put_handoff, f"ai_stream:{stream_id}", pending, AI_STREAM_TTL_SECONDS
+    )
+    return f"/ai/stream/{stream_id}"
+
+
+async def stream_ai_text(prompt: str):
+    """
+    Async generator over the text chunks of a streamed Gemini completion. Shares
+    the AI_SEMAPHORE with generate_ai_text and enforces AI_TIMEOUT_SECONDS as an
+    overall deadline for the whole stream.
+    """
+    deadline = time.monotonic() + AI_TIMEOUT_SECONDS
+    model = await gemini_model.get()
+    async with AI_SEMAPHORE:
+        with AI_INFLIGHT.track_inprogress():
+            responses = await asyncio.wait_for(
+                model.generate_content_async(prompt, stream=True),
+                timeout=AI_TIMEOUT_SECONDS,
+            )
+            chunks = responses.__aiter__()
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), timeout=remaining)
+                except StopAsyncIteration:
+                    return
+                if chunk.text:
+                    yield chunk.text
+
+
+async def stream_ai_and_log(
+    user: Optional[User],
+    endpoint_name: str,
+    prompt: str,
+    prompt_template_id: str,
+    user_input_text: str,
+    control_id: Optional[str] = None,
+    section_name: Optional[str] = None,
+    guidance_version: Optional[str] = None,
+):
+    """
+    Streaming counterpart of call_ai_and_log. Yields the response text chunk by
+    chunk, with an error message as the last chunk if the call fails, and logs
+    the same structured events once the stream has finished. A cached response
+    is yielded in one go; identical requests already streaming share one
+    upstream stream, linked through upstream_call_id.
+    """
+    interaction_id = str(uuid.uuid4())
+    username = user.username if user else "anonymous"
+
+    cache_key = ai_cache_key(
+        prompt_template_id, user_input_text, control_id, section_name, guidance_version
+    )
+    cached_text = lookup_ai_cache(cache_key)
+    if cached_text is not None:
+        live_metrics.record(username, endpoint_name, False)
+        log.info(
+            "ai_cache_hit",
+            interaction_id=interaction_id,
+            endpoint_name=endpoint_name,
+            username=username,
+            control_id=control_id,
+            section_name=section_name,
+            prompt_template_id=prompt_template_id,
+            ai_model_name=MODEL_NAME,
+            **ai_cache_log_fields(),
+        )
+        yield cached_text
+        return
+
+    shared, coalesced = join_inflight_ai_stream(cache_key, prompt)
+    live_metrics.record(username, endpoint_name, True)
+    log.info(
+        "ai_request_sent",
+        interaction_id=interaction_id,
+        upstream_call_id=shared.upstream_call_id,
+        coalesced=coalesced,
+        endpoint_name=endpoint_name,
+        username=username,
+        control_id=control_id,
+        section_name=section_name,
+        prompt_template_id=prompt_template_id,
+        ai_model_name=MODEL_NAME,
+        request_payload={
+            "prompt_length": len(prompt),
+            "user_input_text": user_input_text,
+        },
+        **ai_cache_log_fields(),
+    )
+
+    start_time = time.time()
+    chunks: List[str] = []
+    try:
+        async for chunk_text in shared.subscribe():
+            chunks.append(chunk_text)
+            yield chunk_text
+        ai_response_text = "".join(chunks)
+        ai_response_cache[cache_key] = ai_response_text.strip()
+        latency_ms = (time.time() - start_time) * 1000
+        observe_ai_call(prompt_template_id, latency_ms, streamed=True, failed=False)
+        log.info(
+            "ai_response_received",
+            interaction_id=interaction_id,
+            upstream_call_id=shared.upstream_call_id,
+            coalesced=coalesced,
+            username=username,
+            response_latency_ms=round(latency_ms, 2),
+            response_payload={"response_text": ai_response_text.strip()},
+            streamed=True,
+        )
+    except Exception as e:
+        latency_ms = (time.time() - start_time) * 1000
+        observe_ai_call(prompt_template_id, latency_ms, streamed=True, failed=True)
+        if isinstance(e, asyncio.TimeoutError):
+            e = f"AI call timed out after {AI_TIMEOUT_SECONDS:g}s"
+        log.error(
+            "ai_call_failed",
+            interaction_id=interaction_id,
+            upstream_call_id=shared.upstream_call_id,
+            coalesced=coalesced,
+            username=username,
+            response_latency_ms=round(latency_ms, 2),
+            error_message=str(e),
+        )
+        yield f"\n\nError: Could not process request. Details: {e}"
+
+
+def sse_event(event: str, data: str) -> str:
+    """Formats a server-sent event; multi-line data needs one 'data:' line per line."""
+    data_lines = "".join(f"data: {line}\n" for line in data.splitlines() or [""])
+    return f"event: {event}\n{data_lines}\n"
+
+
 # --- Core Endpoints ---
 
 
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
     """Serves the main index page with the list of all controls."""
-    response_time = time.time() - request.state.start_time
     user = getattr(request.state, "user", None)
+    etag = make_etag(
+        "index", APP_VERSION, shared_state.revision, user.username if user else None, user.role if user else None
+    )
+    if etag_matches(request, etag):
+        return not_modified(etag, REVALIDATE_CACHE_CONTROL)
+
+    response_time = time.time() - request.state.start_time
     context = {
         "request": request,
-        "controls": controls,
-        "controls_count": len(controls),
+        "control_list_html": render_control_list("", page=1),
+        "controls_count": len(control_repo),
         "response_time": response_time,
         "user": user,
         "app_version": APP_VERSION,
     }
-    return templates.TemplateResponse("index.html", context)
+    return with_cache_headers(
+        templates.TemplateResponse("index.html", context), etag, REVALIDATE_CACHE_CONTROL
+    )
+
+@app.get("/metrics")
+async def prometheus_metrics(request: Request):
+    """Prometheus text exposition of the in-process (or, under gunicorn, all-worker) metrics."""
+    user = getattr(request.state, "user", None)
+    if not (
+        METRICS_PUBLIC
+        or has_metrics_bearer_token(request.headers.get("authorization"))
+        or (user and user.role == "admin")
+    ):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    # Multiprocess mode reads one file per worker; keep that off the event loop
+    payload = await asyncio.to_thread(metrics_payload)
+    return Response(content=payload, media_type=CONTENT_TYPE_LATEST)
+
+
+@app.get("/ready")
+async def readiness():
+    """
+    Readiness probe: 200 once the critical initializers succeeded, 503 otherwise.
+    The body is the startup report, with per-initializer and lazy client timings.
+    """
+    return JSONResponse(startup.report(), status_code=200 if startup.ready else 503)
+
 
 @app.get("/api/metrics")
-async def get_metrics():
+async def get_metrics(request: Request):
     """
-    Reads the metrics.json file from the mounted GCS volume and returns it.
+    Serves the metrics.json written by the metrics job (metrics_reader's
+    in-memory copy) brought up to date with the live counts. Nothing here
+    touches the warehouse or, on the request path, the disk.
     """
-    # The mount path for the bucket inside the Cloud Run container
-    metrics_path = Path("/mnt/gcs/metrics.json")
-    
-    if not metrics_path.exists():
-        return {"error": "Metrics file not found. The job may not have run yet."}
-    
-    try:
-        with open(metrics_path, 'r') as f:
-            data = json.load(f)
-        return data
-    except Exception as e:
-        log.error("metrics_read_failed", error=str(e))
-        return {"error": f"Failed to read or parse metrics file: {e}"}
+    snapshot, error = await metrics_reader.get()
+    if snapshot is None and not live_metrics.merged:
+        return {"error": error}
+    body, etag = current_metrics_body(snapshot)
+    if etag_matches(request, etag):
+        return not_modified(etag, METRICS_CACHE_CONTROL)
+    return Response(
+        content=body,
+        media_type="application/json",
+        headers={"ETag": etag, "Cache-Control": METRICS_CACHE_CONTROL},
+    )
 
 
 @app.get("/chat", response_class=HTMLResponse)
@@ -364,24 +1567,12 @@ async def get_chat_workspace(request: Request):
 
 
 @app.post("/search", response_class=HTMLResponse)
-async def search_controls(request: Request, query: str = Form(...)):
-    """Filters controls and returns the updated list as an HTML fragment."""
-    search_term = query.lower().strip()
-    if not search_term:
-        filtered_controls = controls
-    else:
-        filtered_controls = [
-            c
-            for c in controls
-            if search_term in c.name.lower()
-            or search_term in c.risk_id.lower()
-            or search_term in c.owner.lower()
-            or search_term in c.status.lower()
-        ]
-    return templates.TemplateResponse(
-        "partials/control_list.html",
-        {"request": request, "controls": filtered_controls},
-    )
+async def search_controls(request: Request, query: str = Form(""), page: int = Form(1)):
+    """
+    Returns one page of relevance-ranked controls as an HTML fragment. The last row
+    of a page loads the next one when it scrolls into view.
+    """
+    return HTMLResponse(content=render_control_list(query.strip(), page=page))
 
 
 @app.get("/controls/{control_id}", response_class=HTMLResponse)
@@ -395,13 +1586,18 @@ async def get_control(request: Request, control_id: str):
     if not control:
         raise HTTPException(status_code=404, detail="Control not found")
 
-    _, best_practices_count = load_best_practices(control.id)
+    _, best_practices_count, guidance_version = load_best_practices(control.id)
+    etag = make_etag(
+        "control", APP_VERSION, shared_state.revision, guidance_version, user.username if user else None
+    )
+    if etag_matches(request, etag):
+        return not_modified(etag, REVALIDATE_CACHE_CONTROL)
 
     response_time = time.time() - request.state.start_time
     context = {
         "request": request,
         "control": control,
-        "controls_count": len(controls),
+        "controls_count": len(control_repo),
         "response_time": response_time,
         "best_practices_count": best_practices_count,
         "username": user.username if user else None,
@@ -410,7 +1606,9 @@ async def get_control(request: Request, control_id: str):
 
     # This endpoint now renders the simplified control_details.html,
     # which in turn includes the new assessment_workspace.html partial.
-    return templates.TemplateResponse("control_details.html", context)
+    return with_cache_headers(
+        templates.TemplateResponse("control_details.html", context), etag, REVALIDATE_CACHE_CONTROL
+    )
 
 
 @app.post("/ai/rephrase-text")
@@ -428,15 +1626,16 @@ async def rephrase_text(
     if not control:
         return HTMLResponse("Error: Control not found.", status_code=404)
 
-    best_practices, best_practices_count = load_best_practices(control_id)
+    best_practices, best_practices_count, guidance_version = load_best_practices(control_id)
 
     """Takes user text and returns a complete, new textarea element with the rephrased text."""
-    if not GEMINI_MODEL:
+    if not await gemini_model.get():
         rephrased_text = "AI model is not configured."
     elif not text.strip():
         rephrased_text = ""
     else:
         # NEW, MORE RESTRICTIVE PROMPT
+        prompt_started = time.perf_counter()
         prompt = f"""
         You are a GRC writing assistant. Your task is to rewrite the user's input text to make it sound more professional and concise.
 
@@ -466,9 +1665,10 @@ async def rephrase_text(
     3.  Do NOT use Markdown formatting.
     4.  Your entire response must be the improved text and nothing else.
     """
+        record_phase("prompt", ms_since(prompt_started))
 
         # try:
-        #     response = GEMINI_MODEL.generate_content(prompt)
+        #     response = model.generate_content(prompt)
         #     rephrased_text = response.text.strip()
         # except Exception as e:
         #     rephrased_text = f"Error: Could not rephrase text. Details: {e}"
@@ -479,6 +1679,7 @@ async def rephrase_text(
             user_input_text=text,  # <-- Added this
             control_id=control_id,
             section_name=section_title,
+            guidance_version=guidance_version,
         )
     response_time = time.time() - request.state.start_time
 
@@ -488,7 +1689,7 @@ async def rephrase_text(
         "element_id": element_id,
         "element_name": element_name,
         "placeholder": placeholder,
-        "controls_count": len(controls),
+        "controls_count": len(control_repo),
         "response_time": response_time,
         "best_practices_count": best_practices_count,
     }
@@ -514,16 +1715,17 @@ async def review_text(
     section_title: str = Form(...),
 ):
     """Takes user text and returns critical questions from three GRC personas."""
-    if not GEMINI_MODEL:
+    if not await gemini_model.get():
         return HTMLResponse("<p class='text-red-500'>AI model not configured.</p>")
 
-    best_practices, best_practices_count = load_best_practices(control_id)
-
     control = find_control_by_id(control_id)
     if not control:
         return HTMLResponse("Error: Control not found.", status_code=404)
 
+    best_practices, best_practices_count, guidance_version = load_best_practices(control_id)
+
     # CONTEXT-AWARE PROMPT
+    prompt_started = time.perf_counter()
     prompt = f"""
     You are a panel of three senior GRC experts reviewing a specific piece of a control assessment.
 
@@ -548,6 +1750,23 @@ async def review_text(
     - **As a Compliance Manager:** [Your question, focusing on adherence to policy, standards, or regulations]
     - **As an Audit Manager:** [Your question, focusing on testability, evidence, and repeatability]
     """
+    record_phase("prompt", ms_since(prompt_started))
+    if AI_STREAMING:
+        stream_url = await register_ai_stream(
+            request,
+            prompt=prompt,
+            prompt_template_id="review_v0.1",
+            user_input_text=text,
+            control_id=control_id,
+            section_name=section_title,
+            guidance_version=guidance_version,
+            best_practices_count=best_practices_count,
+        )
+        return templates.TemplateResponse(
+            "partials/review_questions.html",
+            {"request": request, "stream_url": stream_url},
+        )
+
     try:
         ai_response_text = await call_ai_and_log(
             request,
@@ -556,9 +1775,10 @@ async def review_text(
             user_input_text=text,
             control_id=control_id,
             section_name=section_title,
+            guidance_version=guidance_version,
         )
         # Convert the Markdown list from Gemini into HTML
-        questions_html = md.render(ai_response_text)
+        questions_html = render_markdown(ai_response_text)
 
         # 1. Calculate the response time
         response_time = time.time() - request.state.start_time
@@ -567,7 +1787,7 @@ async def review_text(
         context = {
             "request": request,
             "questions_html": questions_html,
-            "controls_count": len(controls),
+            "controls_count": len(control_repo),
             "response_time": response_time,
             "best_practices_count": best_practices_count,
         }
@@ -594,10 +1814,11 @@ async def review_text(
 @app.post("/ai/chat", response_class=HTMLResponse)
 async def general_chat(request: Request, user_message: str = Form(...)):
     """Handles general, non-control-specific chat requests."""
-    if not GEMINI_MODEL:
+    if not await gemini_model.get():
         return HTMLResponse("<p class='text-red-500'>AI model not configured.</p>")
 
     # Use the central guidance to keep the chat focused on GRC topics
+    prompt_started = time.perf_counter()
     prompt = f"""
     You are a helpful and professional GRC (Governance, Risk, and Compliance) assistant.
     Use the following best practices to inform your answers.
@@ -610,10 +1831,28 @@ async def general_chat(request: Request, user_message: str = Form(...)):
     **USER'S QUESTION:**
     {user_message}
     """
+    record_phase("prompt", ms_since(prompt_started))
+
+    if AI_STREAMING:
+        stream_url = await register_ai_stream(
+            request,
+            prompt=prompt,
+            prompt_template_id="chat_v0.1",
+            user_input_text=user_message,
+        )
+        return templates.TemplateResponse(
+            "partials/chat_message_pair.html",
+            {"request": request, "user_message": user_message, "stream_url": stream_url},
+        )
 
     try:
-        response = GEMINI_MODEL.generate_content(prompt)
-        ai_response_html = md.render(response.text)
+        ai_response_text = await call_ai_and_log(
+            request,
+            prompt,
+            prompt_template_id="chat_v0.1",
+            user_input_text=user_message,
+        )
+        ai_response_html = render_markdown(ai_response_text)
 
         # --- OOB Swap Logic ---
         response_time = time.time() - request.state.start_time
@@ -621,7 +1860,7 @@ async def general_chat(request: Request, user_message: str = Form(...)):
             "request": request,
             "user_message": user_message,
             "ai_response_html": ai_response_html,
-            "controls_count": len(controls),
+            "controls_count": len(control_repo),
             "response_time": response_time,
         }
 
@@ -640,41 +1879,68 @@ async def general_chat(request: Request, user_message: str = Form(...)):
         )
 
 
-# --- Admin Endpoints ---
-
-
-@app.get("/admin/users", response_class=HTMLResponse)
-async def manage_users_page(request: Request):
+@app.get("/ai/stream/{stream_id}")
+async def stream_ai_response(request: Request, stream_id: str):
     """
-    Serves the user management page by fetching the LATEST user list
-    directly from BigQuery.
+    Server-sent events for a response registered by /ai/chat or /ai/review-text.
+    Emits 'delta' events with the new raw text (JSON-encoded, so newlines
+    survive), one 'rendered' event with the whole response as HTML, then a
+    single 'done' event carrying the status bar. The markdown is rendered once,
+    not per chunk, so CPU and bytes stay linear in the response length.
     """
+    pending = await asyncio.to_thread(shared_state.take_handoff, f"ai_stream:{stream_id}")
     user = getattr(request.state, "user", None)
-    if not user or user.role != "admin":
-        raise HTTPException(status_code=403, detail="Access Forbidden")
+    if not pending or pending["username"] != (user.username if user else None):
+        raise HTTPException(status_code=404, detail="Stream not found")
+
+    async def event_stream():
+        chunks: List[str] = []
+        async for chunk_text in stream_ai_and_log(
+            user,
+            pending["endpoint_name"],
+            pending["prompt"],
+            prompt_template_id=pending["prompt_template_id"],
+            user_input_text=pending["user_input_text"],
+            control_id=pending.get("control_id"),
+            section_name=pending.get("section_name"),
+            guidance_version=pending.get("guidance_version"),
+        ):
+            chunks.append(chunk_text)
+            yield sse_event("delta", json.dumps(chunk_text))
+        yield sse_event("rendered", render_markdown("".join(chunks)))
 
-    # --- CHANGE: Query BigQuery directly instead of using the in-memory list ---
-    all_users = []
-    if not BQ_CLIENT:
-        logging.error("BigQuery client not available for manage_users_page.")
-    else:
-        query = f"SELECT username, email, token, role, created_on FROM `{USER_TABLE_ID}` ORDER BY created_on"
-        try:
-            query_job = BQ_CLIENT.query(query)
-            for row in query_job:
-                user_data = dict(row)
-                user_data["created_on"] = user_data["created_on"].isoformat() + "Z"
-                all_users.append(User(**user_data))
-        except Exception as e:
-            logging.error(f"Failed to fetch users from BigQuery for admin page: {e}")
-            # We can continue with an empty list to avoid crashing the page
+        context = {
+            "request": request,
+            "controls_count": len(control_repo),
+            "response_time": time.time() - pending["start_time"],
+            "best_practices_count": pending.get("best_practices_count"),
+        }
+        status_bar_html = templates.get_template("partials/status_bar.html").render(
+            context
+        )
+        yield sse_event("done", status_bar_html)
 
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# --- Admin Endpoints ---
+
+
+def render_users_page(request: Request, user: User, refresh_error: Optional[str] = None) -> HTMLResponse:
     response_time = time.time() - request.state.start_time
     context = {
         "request": request,
         "user": user,
-        "all_users": all_users,  # This list is now always up-to-date
-        "controls_count": len(controls),
+        "all_users": user_repo.all(),
+        "users_refreshed_at": user_repo.last_refreshed_at,
+        "pending_user_writes": sum(user_repo.pending_writes.values()),
+        "user_write_failures": list(user_repo.write_failures),
+        "refresh_error": refresh_error,
+        "controls_count": len(control_repo),
         "response_time": response_time,
     }
 
@@ -684,6 +1950,37 @@ async def manage_users_page(request: Request):
     return HTMLResponse(content=users_page_html + status_bar_html)
 
 
+@app.get("/admin/users", response_class=HTMLResponse)
+async def manage_users_page(request: Request):
+    """
+    Serves the user management page from the in-memory user directory, which is
+    refreshed from the user backend in the background.
+    """
+    user = getattr(request.state, "user", None)
+    if not user or user.role != "admin":
+        raise HTTPException(status_code=403, detail="Access Forbidden")
+    return render_users_page(request, user)
+
+
+@app.post("/admin/users/refresh", response_class=HTMLResponse)
+async def refresh_users_now(request: Request):
+    """Re-reads every user from the user backend and serves the refreshed page."""
+    user = getattr(request.state, "user", None)
+    if not user or user.role != "admin":
+        raise HTTPException(status_code=403, detail="Access Forbidden")
+
+    refresh_error = None
+    if user_repo.backend is None:
+        refresh_error = "User backend not configured."
+    else:
+        try:
+            await refresh_users(full=True)
+        except Exception as e:
+            log.error("users_refresh_failed", error=str(e))
+            refresh_error = "Could not refresh users; showing the last loaded list."
+    return render_users_page(request, user, refresh_error)
+
+
 @app.post("/admin/users/add", response_class=HTMLResponse)
 async def add_user(request: Request, username: str = Form(...), role: str = Form(...), email: str = Form(...)):
     """Handles the creation of a new user in BigQuery."""
@@ -691,45 +1988,19 @@ async def add_user(request: Request, username: str = Form(...), role: str = Form
     if not user or user.role != "admin":
         raise HTTPException(status_code=403, detail="Access Forbidden")
 
-    new_token = secrets.token_hex(16)
-    created_on = datetime.utcnow()  # BQ TIMESTAMP type prefers datetime objects
+    if user_writes is None:
+        raise HTTPException(status_code=500, detail="Database client not configured.")
 
-    # Pydantic model for in-memory use
     new_user = User(
         email=email,
         username=username,
-        token=new_token,
+        token=secrets.token_hex(16),
         role=role,
-        created_on=created_on.isoformat() + "Z",
+        created_on=datetime.utcnow().isoformat() + "Z",
     )
 
-    # --- NEW: BigQuery Insert Logic ---
-    if not BQ_CLIENT:
-        raise HTTPException(status_code=500, detail="Database client not configured.")
-
-    rows_to_insert = [
-        {
-            "email": email,
-            "username": username,
-            "token": new_token,
-            "role": role,
-            "created_on": created_on.isoformat(),
-        }
-    ]
-
-    try:
-        errors = BQ_CLIENT.insert_rows_json(USER_TABLE_ID, rows_to_insert)
-        if errors:
-            logging.error(f"BigQuery insert errors: {errors}")
-            raise HTTPException(
-                status_code=500, detail="Could not save new user to database."
-            )
-    except Exception as e:
-        log.error("user_add_failed_bq", error=str(e))
-        raise HTTPException(status_code=500, detail="Could not save new user.")
-
-    # Add to the in-memory dictionary for the current session
-    users_by_token[new_user.token] = new_user
+    # Add to the in-memory dictionary of every worker; the user backend is written in the background
+    await publish_user_change(new_user, "upsert")
     log.info(
         "user_created",
         admin_user=user.username,
@@ -787,29 +2058,11 @@ async def delete_user(request: Request, token: str):
     if not user_to_delete:
         raise HTTPException(status_code=404, detail="User not found in memory")
 
-    # --- NEW: BigQuery Delete Logic ---
-    if not BQ_CLIENT:
+    if user_writes is None:
         raise HTTPException(status_code=500, detail="Database client not configured.")
 
-    query = f"DELETE FROM `{USER_TABLE_ID}` WHERE token = @token"
-    job_config = bigquery.QueryJobConfig(
-        query_parameters=[
-            bigquery.ScalarQueryParameter("token", "STRING", token),
-        ]
-    )
-
-    try:
-        BQ_CLIENT.query(
-            query, job_config=job_config
-        ).result()  # .result() waits for job to complete
-    except Exception as e:
-        log.error("user_delete_failed_bq", error=str(e))
-        raise HTTPException(
-            status_code=500, detail="Could not delete user from database."
-        )
-
-    # Remove from in-memory dictionary
-    del users_by_token[token]
+    # Remove from the in-memory dictionary of every worker; the user backend is written in the background
+    await publish_user_change(user_to_delete, "delete")
     log.info(
         "user_deleted",
         admin_user=user.username,
@@ -827,19 +2080,27 @@ async def manage_controls_page(request: Request):
     if not user or user.role != "admin":
         raise HTTPException(status_code=403, detail="Forbidden")
 
+    etag = make_etag("admin_controls", shared_state.revision)
+    if etag_matches(request, etag):
+        return not_modified(etag, REVALIDATE_CACHE_CONTROL)
+
     response_time = time.time() - request.state.start_time
     context = {
         "request": request,
         "user": user,
-        "all_controls": controls,  # Pass the full list of controls
-        "controls_count": len(controls),
+        "controls_count": len(control_repo),
         "response_time": response_time,
     }
 
-    controls_page_html = templates.get_template("admin/controls.html").render(context)
+    # The page lists every control, so it is rendered once per catalog version
+    controls_page_html = fragment_cache.render(
+        "admin/controls.html", (), lambda: {"all_controls": control_repo.all()}
+    )
     status_bar_html = templates.get_template("partials/status_bar.html").render(context)
 
-    return HTMLResponse(content=controls_page_html + status_bar_html)
+    return with_cache_headers(
+        HTMLResponse(content=controls_page_html + status_bar_html), etag, REVALIDATE_CACHE_CONTROL
+    )
 
 
 @app.post("/admin/controls/add", response_class=HTMLResponse)
@@ -869,30 +2130,14 @@ async def add_control(
         sections=[],  # New controls start with empty sections
     )
 
-    # 2. Append to the CSV file
-    csv_path = Path(__file__).parent / "controls.csv"
+    # 2. Persist the new control (one row insert or journal record) and add it to
+    #    the in-memory catalog of every worker
     try:
-        with open(csv_path, mode="a", newline="", encoding="utf-8") as outfile:
-            writer = csv.writer(outfile)
-            # Match the order of your CSV headers
-            writer.writerow(
-                [
-                    new_control.id,
-                    new_control.name,
-                    new_control.risk_id,
-                    new_control.status,
-                    new_control.owner,
-                    new_control.risk_text,
-                    new_control.description,
-                    "[]",
-                ]
-            )
+        await persist_control_change(new_control, "upsert", lambda: control_db.insert(new_control))
     except Exception as e:
-        logging.error(f"Failed to write new control to controls.csv: {e}")
+        logging.error(f"Failed to save new control: {e}")
         raise HTTPException(status_code=500, detail="Could not save new control.")
 
-    # 3. Add to the in-memory list
-    controls.append(new_control)
     logging.info(f"Admin '{user.username}' created new control '{new_control.name}'")
 
     # 4. Return an HTML fragment of the new control row for HTMX
@@ -913,26 +2158,18 @@ async def delete_control(request: Request, control_id: str):
     if not control_to_delete:
         raise HTTPException(status_code=404, detail="Control not found")
 
-    # 1. Remove from in-memory list
-    controls.remove(control_to_delete)
+    # 1. Delete the control from the control store and every worker's catalog
+    try:
+        await persist_control_change(control_to_delete, "delete", lambda: control_db.delete(control_id))
+    except Exception as e:
+        logging.error(f"Failed to delete control: {e}")
+        raise HTTPException(status_code=500, detail="Could not delete control.")
+
     logging.info(
         f"Admin '{user.username}' deleted control '{control_to_delete.name}' (ID: {control_id})"
     )
 
-    # 2. Rewrite the CSV file without the deleted control
-    csv_path = Path(__file__).parent / "controls.csv"
-    current_controls_dict = [c.model_dump() for c in controls]
-
-    with open(csv_path, mode="w", newline="", encoding="utf-8") as outfile:
-        # Important: Get the fieldnames from the Pydantic model to ensure order
-        writer = csv.DictWriter(outfile, fieldnames=Control.model_fields.keys())
-        writer.writeheader()
-        for control_dict in current_controls_dict:
-            # Convert the 'sections' list back to a JSON string for CSV storage
-            control_dict["sections"] = json.dumps(control_dict["sections"])
-            writer.writerow(control_dict)
-
-    # 3. Return an empty 200 OK response for HTMX
+    # 2. Return an empty 200 OK response for HTMX
     return Response(status_code=200)
 
 
@@ -987,11 +2224,13 @@ async def update_control(request: Request, control_id: str):
     form_data = await request.form()
 
     # Update main attributes (This part is correct)
-    control_to_update.name = form_data.get("name")
-    control_to_update.risk_id = form_data.get("risk_id")
-    control_to_update.owner = form_data.get("owner")
-    control_to_update.risk_text = form_data.get("risk_text")
-    control_to_update.description = form_data.get("description")
+    changes = {
+        "name": form_data.get("name"),
+        "risk_id": form_data.get("risk_id"),
+        "owner": form_data.get("owner"),
+        "risk_text": form_data.get("risk_text"),
+        "description": form_data.get("description"),
+    }
 
     # Reconstruct the sections list from the form (This part is correct)
     new_sections = []
@@ -1018,24 +2257,17 @@ async def update_control(request: Request, control_id: str):
             i += 1
         else:
             break
-    control_to_update.sections = new_sections
-
-    # --- Rewrite the entire CSV file to persist the changes ---
-    csv_path = Path(__file__).parent / "controls.csv"
-
-    controls_for_csv = copy.deepcopy(controls)
-    list_to_write = [c.model_dump() for c in controls_for_csv]
+    changes["sections"] = new_sections
 
+    # --- Persist just this control's row, then apply it in every worker ---
+    updated_control = control_to_update.model_copy(update=changes)
     try:
-        with open(csv_path, mode="w", newline="", encoding="utf-8") as outfile:
-            writer = csv.DictWriter(outfile, fieldnames=Control.model_fields.keys())
-            writer.writeheader()
-            for control_dict in list_to_write:
-                # 'sections' is already a list of dicts here from model_dump()
-                control_dict["sections"] = json.dumps(control_dict["sections"])
-                writer.writerow(control_dict)
+        await persist_control_change(
+            updated_control, "upsert", lambda: control_db.update(updated_control)
+        )
     except Exception as e:
-        logging.error(f"Failed to rewrite controls.csv: {e}")
+        logging.error(f"Failed to update control: {e}")
+        raise HTTPException(status_code=500, detail="Could not update control.")
 
     logging.info(f"Admin '{user.username}' updated control '{control_to_update.name}'")
 
@@ -1045,6 +2277,22 @@ async def update_control(request: Request, control_id: str):
     )
 
 
+@app.get("/admin/controls/export")
+async def export_controls(request: Request):
+    """Downloads the control catalog in the controls.csv format."""
+    user = getattr(request.state, "user", None)
+    if not user or user.role != "admin":
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+    buffer = io.StringIO()
+    await asyncio.to_thread(control_db.export_csv, buffer)
+    return Response(
+        content=buffer.getvalue(),
+        media_type="text/csv",
+        headers={"Content-Disposition": 'attachment; filename="controls.csv"'},
+    )
+
+
 @app.get("/admin/controls/sections/new", response_class=HTMLResponse)
 async def get_new_section_row(request: Request, index: int):
     """Returns an HTML fragment for a new, blank workspace section row."""
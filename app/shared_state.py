@@ -0,0 +1,203 @@
+"""
+State shared by the gunicorn workers of one container, in a local SQLite file.
+
+Every worker keeps users and the control catalog in memory. Mutations are
+published to an ordered change feed, and every worker, including the one that
+made the change, applies the feed to its in-memory state in feed order. The
+feed also serves as a cross-process write lock, so its order matches the
+order in which the writes were persisted, and two workers that have applied
+the feed up to the same revision hold the same state.
+
+A small one-shot "handoff" table carries short-lived values, such as pending
+AI streams, from the worker that created them to whichever worker serves the
+follow-up request. Claims mark keys with an operation still in flight in some
+worker, such as a user write waiting for BigQuery, so that no worker starts a
+conflicting one.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+from pydantic import BaseModel
+
+
+class Change(BaseModel):
+    seq: int
+    topic: str  # "user" or "control"
+    key: str
+    op: str  # "upsert", "delete", or for users "settled" once the backend write finished
+    payload: Optional[dict] = None
+
+
+class ClaimConflict(Exception):
+    """Raised inside publish() to roll back a change whose key is already claimed."""
+
+
+class SharedState:
+    """
+    Change feed and handoff table in one SQLite database (WAL mode). Writes use
+    their own connection so that a write held open in a worker thread never
+    blocks poll() on the event loop.
+    """
+
+    def __init__(self, path: Path, retention: int = 10_000):
+        self.path = Path(path)
+        self.retention = retention
+        self._read_conn = self._connect()
+        self._write_conn = self._connect()
+        self._read_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        with self._write_lock:
+            self._write_conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS changes (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    topic TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    op TEXT NOT NULL,
+                    payload TEXT
+                );
+                CREATE TABLE IF NOT EXISTS handoffs (
+                    key TEXT PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS claims (
+                    key TEXT PRIMARY KEY,
+                    expires_at REAL NOT NULL
+                );
+                """
+            )
+        # Feed position this process has applied up to. Read before the initial
+        # load, so changes racing with it are replayed rather than missed.
+        self.revision = self._max_seq()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def close(self):
+        self._read_conn.close()
+        self._write_conn.close()
+
+    def _max_seq(self) -> int:
+        with self._read_lock:
+            row = self._read_conn.execute("SELECT MAX(seq) FROM changes").fetchone()
+        return row[0] or 0
+
+    # --- Change feed ---
+
+    @contextmanager
+    def publish(self, topic: str, key: str, op: str, payload: Optional[dict] = None) -> Iterator[None]:
+        """
+        Holds the cross-process write lock while the body persists the change,
+        then appends it to the feed. Nothing is published if the body raises.
+        The change reaches this process's in-memory state through poll(), like
+        everyone else's. Blocking; run it off the event loop.
+        """
+        with self._write_lock:
+            self._write_conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+                cursor = self._write_conn.execute(
+                    "INSERT INTO changes (topic, key, op, payload) VALUES (?, ?, ?, ?)",
+                    (topic, key, op, json.dumps(payload) if payload is not None else None),
+                )
+                self._write_conn.execute(
+                    "DELETE FROM changes WHERE seq <= ?", (cursor.lastrowid - self.retention,)
+                )
+                self._write_conn.execute("COMMIT")
+            except BaseException:
+                self._write_conn.execute("ROLLBACK")
+                raise
+
+    def announce(self, topic: str, key: str, op: str, payload: Optional[dict] = None):
+        """Publishes a change that was already persisted elsewhere (e.g. BigQuery)."""
+        with self.publish(topic, key, op, payload):
+            pass
+
+    def poll(self) -> Optional[List[Change]]:
+        """
+        Changes since the last poll, in feed order; the caller must apply all of
+        them before its next poll. Returns None when the feed was pruned past our
+        position, in which case the caller resynchronises from the underlying stores.
+        """
+        with self._read_lock:
+            rows = self._read_conn.execute(
+                "SELECT seq, topic, key, op, payload FROM changes WHERE seq > ? ORDER BY seq",
+                (self.revision,),
+            ).fetchall()
+        if not rows:
+            return []
+        # AUTOINCREMENT never reuses or skips positions, so a hole means pruning
+        self.revision, pruned = rows[-1][0], rows[0][0] > self.revision + 1
+        if pruned:
+            return None
+        return [
+            Change(
+                seq=seq,
+                topic=topic,
+                key=key,
+                op=op,
+                payload=json.loads(payload) if payload is not None else None,
+            )
+            for seq, topic, key, op, payload in rows
+        ]
+
+    # --- One-shot handoffs ---
+
+    def put_handoff(self, key: str, payload: dict, ttl_seconds: float):
+        now = time.time()
+        with self._write_lock:
+            self._write_conn.execute("DELETE FROM handoffs WHERE expires_at < ?", (now,))
+            self._write_conn.execute(
+                "INSERT OR REPLACE INTO handoffs (key, payload, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(payload), now + ttl_seconds),
+            )
+
+    def take_handoff(self, key: str) -> Optional[dict]:
+        """Removes and returns an unexpired handoff, or None."""
+        with self._write_lock:
+            row = self._write_conn.execute(
+                "DELETE FROM handoffs WHERE key = ? RETURNING payload, expires_at", (key,)
+            ).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return json.loads(row[0])
+
+    # --- Claims ---
+
+    def announce_claimed(self, topic: str, key: str, op: str, payload: Optional[dict], ttl_seconds: float) -> bool:
+        """
+        Claims topic/key and publishes the change in one transaction. Returns
+        False, publishing nothing, while another unexpired claim holds the key.
+        The TTL frees the key if the claiming process dies before releasing it.
+        """
+        claim_key = f"{topic}:{key}"
+        now = time.time()
+        try:
+            with self.publish(topic, key, op, payload):
+                row = self._write_conn.execute(
+                    "SELECT expires_at FROM claims WHERE key = ?", (claim_key,)
+                ).fetchone()
+                if row is not None and row[0] >= now:
+                    raise ClaimConflict(claim_key)
+                self._write_conn.execute(
+                    "INSERT OR REPLACE INTO claims (key, expires_at) VALUES (?, ?)",
+                    (claim_key, now + ttl_seconds),
+                )
+        except ClaimConflict:
+            return False
+        return True
+
+    def announce_released(self, topic: str, key: str, op: str, payload: Optional[dict] = None):
+        """Publishes the change that ends a claimed operation and drops the claim, in one transaction."""
+        with self.publish(topic, key, op, payload):
+            self._write_conn.execute("DELETE FROM claims WHERE key = ?", (f"{topic}:{key}",))
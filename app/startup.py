@@ -0,0 +1,156 @@
+"""
+Application startup: initializers that run concurrently in the lifespan phase,
+clients that are only created on first use, and the per-initializer timing
+report served by the readiness endpoint.
+"""
+
+import asyncio
+import inspect
+import threading
+import time
+from typing import Any, Callable, Dict, Generic, Iterable, List, Optional, TypeVar
+
+import structlog
+from pydantic import BaseModel
+
+log = structlog.get_logger()
+
+T = TypeVar("T")
+
+
+def _ms_since(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 2)
+
+
+class InitializerResult(BaseModel):
+    name: str
+    critical: bool
+    status: str = "pending"  # "pending", "running", "ok" or "failed"
+    started_ms: Optional[float] = None  # offset from the start of startup
+    duration_ms: Optional[float] = None
+    error: Optional[str] = None
+
+
+class LazyClientResult(BaseModel):
+    name: str
+    created: bool
+    duration_ms: Optional[float] = None
+    error: Optional[str] = None
+
+
+class LazyClient(Generic[T]):
+    """
+    Builds a client the first time it is asked for, so startup does not pay for
+    clients that may never be used. Creation runs once even under concurrent
+    first use; if it fails the client stays None, as the eager version did.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], T]):
+        self.name = name
+        self.factory = factory
+        self._client: Optional[T] = None
+        self._done = False
+        self._lock = threading.Lock()
+        self.result = LazyClientResult(name=name, created=False)
+
+    def get_sync(self) -> Optional[T]:
+        """Returns the client, creating it in the calling thread if needed. May block."""
+        if self._done:
+            return self._client
+        with self._lock:
+            if not self._done:
+                start = time.perf_counter()
+                try:
+                    self._client = self.factory()
+                    self.result.created = True
+                    log.info("lazy_client_created", client=self.name, duration_ms=_ms_since(start))
+                except Exception as e:
+                    self.result.error = str(e)
+                    log.error("lazy_client_failed", client=self.name, error=str(e))
+                self.result.duration_ms = _ms_since(start)
+                self._done = True
+        return self._client
+
+    async def get(self) -> Optional[T]:
+        """Returns the client, creating it in a worker thread on first use."""
+        if self._done:
+            return self._client
+        return await asyncio.to_thread(self.get_sync)
+
+
+class Startup:
+    """
+    Named initializers with dependencies. Critical initializers are awaited by
+    run() and decide readiness; background ones keep running after the app has
+    started serving. A sync initializer runs in a worker thread so independent
+    ones overlap; an initializer whose dependency failed fails without running.
+    """
+
+    def __init__(self):
+        self.results: Dict[str, InitializerResult] = {}
+        self.lazy_clients: List[LazyClient] = []
+        self._initializers: Dict[str, Callable[[], Any]] = {}
+        self._depends_on: Dict[str, Iterable[str]] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.started_at: Optional[float] = None
+        self.duration_ms: Optional[float] = None
+
+    def add(self, name: str, initializer: Callable[[], Any], depends_on: Iterable[str] = (), critical: bool = True):
+        self.results[name] = InitializerResult(name=name, critical=critical)
+        self._initializers[name] = initializer
+        self._depends_on[name] = tuple(depends_on)
+
+    def lazy(self, client: LazyClient) -> LazyClient:
+        """Lists a lazily created client in the report."""
+        self.lazy_clients.append(client)
+        return client
+
+    async def _run_one(self, name: str):
+        result = self.results[name]
+        for dependency in self._depends_on[name]:
+            await self._tasks[dependency]
+            if self.results[dependency].status != "ok":
+                result.status, result.error = "failed", f"dependency {dependency} failed"
+                return
+        initializer = self._initializers[name]
+        result.status = "running"
+        result.started_ms = _ms_since(self.started_at)
+        start = time.perf_counter()
+        try:
+            if inspect.iscoroutinefunction(initializer):
+                await initializer()
+            else:
+                await asyncio.to_thread(initializer)
+            result.status = "ok"
+        except Exception as e:
+            result.status, result.error = "failed", str(e)
+            log.error("startup_initializer_failed", initializer=name, error=str(e))
+        result.duration_ms = _ms_since(start)
+
+    async def run(self) -> List[asyncio.Task]:
+        """Runs every initializer and waits for the critical ones; returns the background tasks."""
+        self.started_at = time.perf_counter()
+        for name in self._initializers:
+            self._tasks[name] = asyncio.create_task(self._run_one(name))
+        critical = [task for name, task in self._tasks.items() if self.results[name].critical]
+        await asyncio.gather(*critical)
+        self.duration_ms = _ms_since(self.started_at)
+        log.info(
+            "startup_completed",
+            ready=self.ready,
+            duration_ms=self.duration_ms,
+            initializers_ms={name: result.duration_ms for name, result in self.results.items()},
+        )
+        return [task for name, task in self._tasks.items() if not self.results[name].critical]
+
+    @property
+    def ready(self) -> bool:
+        return all(result.status == "ok" for result in self.results.values() if result.critical)
+
+    def report(self) -> dict:
+        return {
+            "ready": self.ready,
+            "startup_ms": self.duration_ms,
+            "initializers": [result.model_dump() for result in self.results.values()],
+            "lazy_clients": [client.result.model_dump() for client in self.lazy_clients],
+        }
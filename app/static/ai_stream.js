@@ -0,0 +1,51 @@
+// --- START OF FILE ai_stream.js ---
+
+// Streams AI responses into elements rendered with a `data-ai-stream` URL.
+// The server sends `delta` events carrying new raw text (a JSON string), shown
+// as plain text while the response arrives, then a `rendered` event with the
+// whole response as HTML and a final `done` event carrying the status bar,
+// which replaces #status-bar.
+(() => {
+  const connect = (el) => {
+    const url = el.dataset.aiStream;
+    el.removeAttribute("data-ai-stream");
+
+    const source = new EventSource(url);
+
+    let streamed = false;
+    source.addEventListener("delta", (event) => {
+      if (!streamed) {
+        // Replace the placeholder; keep the raw text's line breaks until it is rendered
+        streamed = true;
+        el.textContent = "";
+        el.style.whiteSpace = "pre-wrap";
+      }
+      el.textContent += JSON.parse(event.data);
+    });
+
+    source.addEventListener("rendered", (event) => {
+      el.style.whiteSpace = "";
+      el.innerHTML = event.data;
+    });
+
+    source.addEventListener("done", (event) => {
+      source.close();
+      const statusBar = document.getElementById("status-bar");
+      if (statusBar) {
+        statusBar.outerHTML = event.data;
+      }
+    });
+
+    // Don't let EventSource reconnect and replay a one-shot stream
+    source.onerror = () => source.close();
+  };
+
+  htmx.onLoad((root) => {
+    if (root.matches && root.matches("[data-ai-stream]")) {
+      connect(root);
+    }
+    root.querySelectorAll("[data-ai-stream]").forEach(connect);
+  });
+})();
+
+// --- END OF FILE ai_stream.js ---
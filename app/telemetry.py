@@ -0,0 +1,93 @@
+"""
+Prometheus metrics for the app, exposed in text format at /metrics.
+
+Under gunicorn every worker writes its samples to PROMETHEUS_MULTIPROC_DIR
+(prepared by gunicorn.conf.py) and a scrape of any worker aggregates all of
+them. Without that variable, e.g. under a plain `uvicorn main:app`, the
+metrics cover the current process only.
+"""
+
+import os
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+# Seconds; spans static files up to a slow model call at the AI timeout
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time to serve an HTTP request, by route template.",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+AI_REQUEST_DURATION = Histogram(
+    "ai_request_duration_seconds",
+    "Latency of AI model calls, including coalesced waits and streams.",
+    ["prompt_template_id", "streamed"],
+    buckets=LATENCY_BUCKETS,
+)
+AI_ERRORS = Counter(
+    "ai_errors",
+    "AI model calls that failed or timed out.",
+    ["prompt_template_id"],
+)
+AI_INFLIGHT = Gauge(
+    "ai_inflight_calls",
+    "Upstream AI model calls currently in progress.",
+    multiprocess_mode="livesum",
+)
+AI_CACHE_LOOKUPS = Counter(
+    "ai_cache_lookups",
+    "AI response cache lookups by result (hit or miss).",
+    ["result"],
+)
+FRAGMENT_CACHE_LOOKUPS = Counter(
+    "fragment_cache_lookups",
+    "Rendered fragment cache lookups by template and result (hit or miss).",
+    ["template", "result"],
+)
+BIGQUERY_CALL_DURATION = Histogram(
+    "bigquery_call_duration_seconds",
+    "Duration of BigQuery calls made by the app.",
+    ["operation"],
+    buckets=LATENCY_BUCKETS,
+)
+
+LOG_RECORDS_DROPPED = Counter(
+    "log_records_dropped",
+    "Log records dropped because the log shipping queue was full, by level.",
+    ["level"],
+)
+LOG_FIELDS_SHORTENED = Counter(
+    "log_fields_shortened",
+    "Oversized log fields truncated or replaced by their hash before shipping.",
+    ["mode"],
+)
+
+
+def route_label(scope: dict) -> str:
+    """Route template for a served request, so /controls/{control_id} is one series."""
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    # Mounted apps (/static) set root_path to their mount point
+    return scope.get("root_path") or "unmatched"
+
+
+def metrics_payload() -> bytes:
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry)
+
@@ -0,0 +1,389 @@
+"""
+User directory: the in-memory users_by_token map, the backends it is
+refreshed from and the queue that writes user changes back to them. BigQuery
+in production; users.csv or an in-memory list stand in for it locally and in
+tests.
+"""
+
+import asyncio
+import csv
+import os
+from collections import deque
+from contextlib import nullcontext
+from datetime import datetime, timedelta, timezone
+from itertools import groupby
+from pathlib import Path
+from typing import Awaitable, Callable, ContextManager, Deque, Dict, Iterable, List, Optional, Protocol, Set
+
+import structlog
+from pydantic import BaseModel
+
+log = structlog.get_logger()
+
+SETTLED_WRITE_RETENTION = timedelta(hours=1)
+
+
+class User(BaseModel):
+    username: str
+    email: str
+    token: str
+    role: str
+    created_on: str
+
+
+def parse_created_on(created_on: str) -> datetime:
+    """created_on is ISO text with a trailing Z; naive values are UTC."""
+    parsed = datetime.fromisoformat(created_on.rstrip("Z"))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+# --- Backends ---
+class UserBackend(Protocol):
+    def fetch_users(self, created_since: Optional[datetime] = None) -> List[User]:
+        """Users created at or after created_since, or every user when it is None."""
+        ...
+
+    def fetch_tokens(self) -> Set[str]:
+        """Tokens of every current user, used to reconcile deletions."""
+        ...
+
+    def insert_users(self, users: List[User]):
+        """Stores new users. Must be safe to retry after a partial failure."""
+        ...
+
+    def delete_users(self, tokens: List[str]):
+        ...
+
+
+class BigQueryUserBackend:
+    def __init__(self, client, table_id: str):
+        self.client = client
+        self.table_id = table_id
+
+    def fetch_users(self, created_since: Optional[datetime] = None) -> List[User]:
+        # Imported here so the other backends work without the BigQuery client library
+        from google.cloud import bigquery
+
+        query = f"SELECT username, email, token, role, created_on FROM `{self.table_id}`"
+        job_config = None
+        if created_since is not None:
+            query += " WHERE created_on >= @created_since"
+            job_config = bigquery.QueryJobConfig(
+                query_parameters=[
+                    bigquery.ScalarQueryParameter("created_since", "TIMESTAMP", created_since),
+                ]
+            )
+        users = []
+        for row in self.client.query(query + " ORDER BY created_on", job_config=job_config):
+            # Convert created_on from datetime to ISO string to match Pydantic model
+            user_data = dict(row)
+            user_data["created_on"] = user_data["created_on"].isoformat() + "Z"
+            users.append(User(**user_data))
+        return users
+
+    def fetch_tokens(self) -> Set[str]:
+        return {row["token"] for row in self.client.query(f"SELECT token FROM `{self.table_id}`")}
+
+    def insert_users(self, users: List[User]):
+        # BQ TIMESTAMP takes the ISO text without the trailing Z
+        rows = [{**user.model_dump(), "created_on": user.created_on.rstrip("Z")} for user in users]
+        # row_ids let BigQuery drop rows a retried batch already streamed
+        errors = self.client.insert_rows_json(self.table_id, rows, row_ids=[user.token for user in users])
+        if errors:
+            raise RuntimeError(f"BigQuery insert errors: {errors}")
+
+    def delete_users(self, tokens: List[str]):
+        from google.cloud import bigquery
+
+        job_config = bigquery.QueryJobConfig(
+            query_parameters=[bigquery.ArrayQueryParameter("tokens", "STRING", tokens)]
+        )
+        query = f"DELETE FROM `{self.table_id}` WHERE token IN UNNEST(@tokens)"
+        self.client.query(query, job_config=job_config).result()  # .result() waits for job to complete
+
+
+class InMemoryUserBackend:
+    """Stand-in for BigQuery in tests; mutate `users` to simulate changes upstream."""
+
+    def __init__(self, users: Iterable[User] = ()):
+        self.users: Dict[str, User] = {user.token: user for user in users}
+
+    def fetch_users(self, created_since: Optional[datetime] = None) -> List[User]:
+        users = sorted(self.users.values(), key=lambda user: parse_created_on(user.created_on))
+        if created_since is None:
+            return users
+        return [user for user in users if parse_created_on(user.created_on) >= created_since]
+
+    def fetch_tokens(self) -> Set[str]:
+        return set(self.users)
+
+    def insert_users(self, users: List[User]):
+        self.users.update((user.token, user) for user in users)
+
+    def delete_users(self, tokens: List[str]):
+        for token in tokens:
+            self.users.pop(token, None)
+
+
+class CsvUserBackend(InMemoryUserBackend):
+    """Reads users.csv on every fetch, for running locally without BigQuery."""
+
+    def __init__(self, path: Path):
+        super().__init__()
+        self.path = path
+
+    def _reload(self):
+        with open(self.path, mode="r", encoding="utf-8") as infile:
+            self.users = {row["token"]: User(**row) for row in csv.DictReader(infile)}
+
+    def fetch_users(self, created_since: Optional[datetime] = None) -> List[User]:
+        self._reload()
+        return super().fetch_users(created_since)
+
+    def fetch_tokens(self) -> Set[str]:
+        self._reload()
+        return super().fetch_tokens()
+
+    def _save(self):
+        temp_path = self.path.with_suffix(".csv.tmp")
+        with open(temp_path, mode="w", newline="", encoding="utf-8") as outfile:
+            writer = csv.DictWriter(outfile, fieldnames=list(User.model_fields))
+            writer.writeheader()
+            writer.writerows(user.model_dump() for user in self.users.values())
+        os.replace(temp_path, self.path)
+
+    def insert_users(self, users: List[User]):
+        self._reload()
+        super().insert_users(users)
+        self._save()
+
+    def delete_users(self, tokens: List[str]):
+        self._reload()
+        super().delete_users(tokens)
+        self._save()
+
+
+# --- Writes ---
+class UserWrite(BaseModel):
+    action: str  # "insert" or "delete"
+    user: User
+
+
+class UserWriteFailure(BaseModel):
+    action: str
+    username: str
+    error: str
+    failed_at: datetime
+
+
+class UserWriteQueue:
+    """
+    Writes user changes to the backend in the background, in submission order, so
+    request handlers only wait for the in-memory update. Consecutive writes of the
+    same kind go out as one batch; a failing batch is retried with backoff and
+    blocks the writes behind it, which keeps the changes to any one token in
+    order. Every write is reported to on_settled, with the error if it finally failed.
+
+    The queue orders the writes of one process only; callers keep a token's
+    writes from racing across processes (see the user write claims in main.py).
+    """
+
+    def __init__(
+        self,
+        backend: UserBackend,
+        on_settled: Callable[[UserWrite, Optional[str]], Awaitable[None]],
+        max_pending: int = 1000,
+        max_batch: int = 500,
+        max_attempts: int = 5,
+        retry_base_seconds: float = 0.5,
+        call_context: Callable[[str], ContextManager] = lambda operation: nullcontext(),
+    ):
+        self.backend = backend
+        self.on_settled = on_settled
+        self.max_batch = max_batch
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.call_context = call_context
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self._in_flight = 0
+
+    def __len__(self) -> int:
+        """Writes not yet settled: the queued ones and the batch being written."""
+        return self._queue.qsize() + self._in_flight
+
+    def submit(self, write: UserWrite):
+        """Queues a write. Raises asyncio.QueueFull when max_pending writes are waiting."""
+        self._queue.put_nowait(write)
+
+    async def run(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            self._in_flight = len(batch)
+            settled = 0
+            try:
+                for action, group in groupby(batch, key=lambda write: write.action):
+                    writes = list(group)
+                    error = await self._write(action, writes)
+                    for write in writes:
+                        await self._settle(write, error)
+                        settled += 1
+            except Exception as e:
+                # Fail the rest of the batch and keep serving the queue
+                log.error("user_write_batch_failed", writes=len(batch) - settled, error=str(e))
+                for write in batch[settled:]:
+                    await self._settle(write, str(e))
+            finally:
+                self._in_flight = 0
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _settle(self, write: UserWrite, error: Optional[str]):
+        # A failing callback (e.g. the shared state is locked) must not stop the writer
+        try:
+            await self.on_settled(write, error)
+        except Exception as e:
+            log.error(
+                "user_write_settle_failed",
+                action=write.action,
+                target_username=write.user.username,
+                write_error=error,
+                error=str(e),
+            )
+
+    async def _write(self, action: str, writes: List[UserWrite]) -> Optional[str]:
+        write_batch = self.backend.insert_users if action == "insert" else self.backend.delete_users
+        items = [write.user if action == "insert" else write.user.token for write in writes]
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                with self.call_context(f"{action}_users"):
+                    await asyncio.to_thread(write_batch, items)
+                log.info("user_write_completed", action=action, users=len(items), attempt=attempt)
+                return None
+            except Exception as e:
+                log.warning("user_write_retry", action=action, users=len(items), attempt=attempt, error=str(e))
+                if attempt == self.max_attempts:
+                    return str(e)
+                await asyncio.sleep(self.retry_base_seconds * 2 ** (attempt - 1))
+
+    async def drain(self, timeout: float):
+        """Waits up to timeout seconds for the queued writes to settle."""
+        await asyncio.wait_for(self._queue.join(), timeout)
+
+
+# --- Repository ---
+class UserSync(BaseModel):
+    """What one refresh read from the backend; applied to the repository separately."""
+
+    users: List[User]
+    live_tokens: Set[str]
+    started_at: datetime
+    full: bool
+
+
+class UserRepository:
+    """
+    users_by_token, kept in step with a UserBackend. A refresh fetches only users
+    created since the high-water mark of created_on, plus the set of current
+    tokens to drop deleted users. fetch() does the (blocking) backend reads and
+    apply() the in-memory update, so the reads can run in a worker thread.
+
+    Local changes (upsert/remove) apply immediately and stay authoritative until
+    their backend write settles, so a refresh cannot undo a write still in flight.
+    """
+
+    def __init__(self, backend: Optional[UserBackend], max_failures: int = 20):
+        self.backend = backend
+        self.users_by_token: Dict[str, User] = {}
+        self.high_water_mark: Optional[datetime] = None
+        self.last_refreshed_at: Optional[datetime] = None
+        # Writes in flight per token, and when each token's last write settled
+        self.pending_writes: Dict[str, int] = {}
+        self.settled_at: Dict[str, datetime] = {}
+        self.write_failures: Deque[UserWriteFailure] = deque(maxlen=max_failures)
+
+    def __len__(self) -> int:
+        return len(self.users_by_token)
+
+    def all(self) -> List[User]:
+        """Every user, oldest first."""
+        return sorted(self.users_by_token.values(), key=lambda user: user.created_on)
+
+    def upsert(self, user: User):
+        self.users_by_token[user.token] = user
+        self.pending_writes[user.token] = self.pending_writes.get(user.token, 0) + 1
+
+    def remove(self, token: str):
+        self.users_by_token.pop(token, None)
+        self.pending_writes[token] = self.pending_writes.get(token, 0) + 1
+
+    def settle(self, write: UserWrite, error: Optional[str] = None):
+        """Marks a write done; a failed one is undone so memory matches the backend again."""
+        token = write.user.token
+        remaining = self.pending_writes.pop(token, 1) - 1
+        if remaining > 0:
+            self.pending_writes[token] = remaining
+        now = datetime.now(timezone.utc)
+        self.settled_at[token] = now
+        if error is None:
+            return
+        if write.action == "insert":
+            self.users_by_token.pop(token, None)
+        else:
+            self.users_by_token[token] = write.user
+        self.write_failures.appendleft(
+            UserWriteFailure(action=write.action, username=write.user.username, error=error, failed_at=now)
+        )
+
+    def resync(self) -> tuple[int, int]:
+        """
+        Rebuilds users_by_token from a full backend read, dropping the record of
+        writes in flight. For when the change feed was pruned past this process:
+        the "settled" changes it missed would otherwise keep their tokens local
+        for good. Blocking; returns the number of users added and removed.
+        """
+        self.pending_writes.clear()
+        self.settled_at.clear()
+        return self.apply(self.fetch(full=True))
+
+    def fetch(self, full: bool = False) -> UserSync:
+        started_at = datetime.now(timezone.utc)
+        # >= on the mark re-reads users sharing its timestamp; apply() dedupes them
+        created_since = None if full else self.high_water_mark
+        users = self.backend.fetch_users(created_since)
+        live_tokens = self.backend.fetch_tokens()
+        return UserSync(users=users, live_tokens=live_tokens, started_at=started_at, full=full)
+
+    def apply(self, sync: UserSync) -> tuple[int, int]:
+        """Applies a fetched sync and returns the number of users added and removed."""
+        # Tokens written since the fetch started: the sync may predate the write
+        local = set(self.pending_writes)
+        local.update(token for token, settled_at in self.settled_at.items() if settled_at >= sync.started_at)
+        # Kept well past this sync in case a slower, earlier-started refresh is still running
+        forget_before = sync.started_at - SETTLED_WRITE_RETENTION
+        self.settled_at = {
+            token: settled_at for token, settled_at in self.settled_at.items() if settled_at >= forget_before
+        }
+        added = 0
+        for user in sync.users:
+            if user.token in local:
+                continue
+            if user.token not in self.users_by_token:
+                added += 1
+            self.users_by_token[user.token] = user
+            created_at = parse_created_on(user.created_on)
+            if self.high_water_mark is None or created_at > self.high_water_mark:
+                self.high_water_mark = created_at
+        # Users created after the fetch started may not be in live_tokens yet
+        removed = [
+            token
+            for token, user in self.users_by_token.items()
+            if token not in sync.live_tokens
+            and token not in local
+            and parse_created_on(user.created_on) < sync.started_at
+        ]
+        for token in removed:
+            del self.users_by_token[token]
+        self.last_refreshed_at = sync.started_at
+        return added, len(removed)
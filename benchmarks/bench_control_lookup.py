@@ -0,0 +1,64 @@
+"""
+Microbenchmark: control lookup cost as the catalog grows.
+
+Compares the old linear scan (next(...) over a list) with ControlRepository's
+id index. Run from the repository root:
+
+    python benchmarks/bench_control_lookup.py
+"""
+
+import random
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+
+from control_store import Control, ControlRepository  # noqa: E402
+
+CATALOG_SIZES = [1_000, 10_000, 50_000, 100_000]
+LOOKUPS = 2_000
+
+
+def make_catalog(size: int) -> list:
+    return [
+        Control(
+            id=f"C-{i:06d}",
+            name=f"Control {i}",
+            risk_id=f"R-{i % 500:03d}",
+            status="Active",
+            owner=f"Owner {i % 50}",
+            risk_text="",
+            description="",
+            sections=[],
+        )
+        for i in range(size)
+    ]
+
+
+def main():
+    rng = random.Random(42)
+    print(f"{'controls':>10} {'linear scan (us)':>18} {'repository (us)':>16}")
+    for size in CATALOG_SIZES:
+        catalog = make_catalog(size)
+        repo = ControlRepository(catalog)
+        ids = [f"C-{rng.randrange(size):06d}" for _ in range(LOOKUPS)]
+
+        def linear():
+            for control_id in ids:
+                next((c for c in catalog if c.id == control_id), None)
+
+        def indexed():
+            for control_id in ids:
+                repo.get(control_id)
+
+        # The linear scan gets slow quickly; sample fewer lookups for large catalogs
+        linear_runs = max(1, 20_000 // size)
+        linear_us = min(timeit.repeat(linear, number=linear_runs, repeat=3))
+        linear_us = linear_us / (linear_runs * LOOKUPS) * 1e6
+        indexed_us = min(timeit.repeat(indexed, number=50, repeat=3)) / (50 * LOOKUPS) * 1e6
+        print(f"{size:>10} {linear_us:>18.2f} {indexed_us:>16.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Microbenchmark: /search latency over a large synthetic catalog.
+
+Builds a ControlRepository with a Zipf-like vocabulary (a few very common GRC
+words plus a long tail) and times ranked, paginated searches, plus the cost of
+keeping the index up to date on admin edits. Run from the repository root:
+
+    python benchmarks/bench_control_search.py [catalog_size]
+"""
+
+import itertools
+import random
+import string
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+
+from control_store import Control, ControlRepository  # noqa: E402
+
+QUERIES = ["a", "acc", "access", "access review", "r-12", "encryp", "vendor patch", "zzz", ""]
+COMMON_WORDS = (
+    "access review privileged account backup encryption vendor change "
+    "incident network firewall password logging monitoring patch"
+).split()
+
+
+def make_catalog(size: int, rng: random.Random) -> list:
+    vocabulary = COMMON_WORDS + [
+        "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10)))
+        for _ in range(20_000)
+    ]
+    # Zipf-like, flattened at the head so the most common words show up in a
+    # large share of the controls without being in every one of them
+    cum_weights = list(itertools.accumulate(1 / (i + 100) for i in range(len(vocabulary))))
+
+    def text(words: int) -> str:
+        return " ".join(rng.choices(vocabulary, cum_weights=cum_weights, k=words))
+
+    return [
+        Control(
+            id=f"C-{i:06d}",
+            name=text(4),
+            risk_id=f"R-{i % 900:03d}",
+            status=rng.choice(["Active", "In Review", "Implemented", None]),
+            owner=rng.choice(["IT Operations", "Security Team", "HR/IT", None]),
+            risk_text=text(15),
+            description=text(35),
+            sections=[],
+        )
+        for i in range(size)
+    ]
+
+
+def timed_ms(fn, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    rng = random.Random(42)
+    catalog = make_catalog(size, rng)
+
+    start = time.perf_counter()
+    repo = ControlRepository(catalog)
+    print(f"Indexed {size} controls in {time.perf_counter() - start:.2f}s\n")
+
+    print(f"{'query':>16} {'matches':>8} {'page 1 (ms)':>12}")
+    for query in QUERIES:
+        page = repo.search(query)
+        print(f"{query!r:>16} {page.total:>8} {timed_ms(lambda: repo.search(query)):>12.2f}")
+
+    edit = timed_ms(
+        lambda: repo.update(catalog[0].id, {"name": f"renamed {rng.random()}"}), repeat=50
+    )
+    print(f"\nIndex update on admin edit: {edit:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
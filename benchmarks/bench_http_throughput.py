@@ -0,0 +1,80 @@
+"""
+HTTP benchmark: requests per second on the index page and a static asset.
+
+Runs a fixed number of concurrent keep-alive clients against a running server for a
+fixed duration. Run it before and after a middleware change against the same server
+setup to compare:
+
+    cd app && gunicorn -w 1 -k uvicorn.workers.UvicornWorker main:app -b 127.0.0.1:8000
+    python benchmarks/bench_http_throughput.py --token <session token>
+
+The token is sent as the session cookie so "/" renders the catalog, not the login dialog.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+DEFAULT_PATHS = ["/", "/static/styles.css"]
+
+
+async def client_loop(client: httpx.AsyncClient, path: str, deadline: float, latencies: list, errors: list):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            response = await client.get(path)
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            errors.append(e)
+            continue
+        latencies.append(time.perf_counter() - start)
+
+
+async def bench_path(base_url: str, path: str, cookies: dict, concurrency: int, duration: float) -> dict:
+    latencies: list = []
+    errors: list = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, cookies=cookies, limits=limits) as client:
+        # Warm up connections and any lazily built state before measuring
+        await asyncio.gather(*(client.get(path) for _ in range(concurrency)))
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(
+            *(client_loop(client, path, deadline, latencies, errors) for _ in range(concurrency))
+        )
+    latencies.sort()
+    return {
+        "path": path,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "rps": len(latencies) / duration,
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else 0.0,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0.0,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--token", default="", help="session token sent as the auth cookie")
+    parser.add_argument("--cookie-name", default="auth_token_session")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per path")
+    parser.add_argument("paths", nargs="*", default=DEFAULT_PATHS)
+    args = parser.parse_args()
+
+    cookies = {args.cookie_name: args.token} if args.token else {}
+    print(f"{args.base_url}  concurrency={args.concurrency}  duration={args.duration:g}s")
+    print(f"{'path':<24}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>9}{'p99 ms':>9}")
+    for path in args.paths:
+        result = await bench_path(args.base_url, path, cookies, args.concurrency, args.duration)
+        print(
+            f"{result['path']:<24}{result['requests']:>10}{result['errors']:>8}"
+            f"{result['rps']:>10.0f}{result['p50_ms']:>9.1f}{result['p99_ms']:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,318 @@
+"""
+Load test: latency percentiles and requests per second for the main user and
+admin endpoints, at one or more concurrency levels, saved as JSON.
+
+Run it against a server using the fake model backend so the AI endpoints cost
+no Vertex quota (the fake's latency, error rate and streaming are set through
+the FAKE_MODEL_* variables), with an admin session token:
+
+    cd app && MODEL_BACKEND=fake gunicorn -w 2 -k uvicorn.workers.UvicornWorker main:app -b 127.0.0.1:8000
+    python benchmarks/bench_load.py --token <admin token> --concurrency 1 8 32
+
+Every AI request sends unique text, so the response cache and call coalescing
+do not hide the model (--repeat-prompts measures the cached path instead).
+Streamed AI responses are timed until the stream's 'done' event. An AI request
+that the app answered with its error message counts under ai_errors, not errors.
+Only read-only admin endpoints are driven, so the user directory and catalog are
+left as they were. Compare a run with an earlier one:
+
+    python benchmarks/bench_load.py --token <admin token> --compare benchmarks/results/<earlier run>.json
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import re
+import subprocess
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+SEARCH_QUERIES = ["access", "access review", "encryp", "vendor patch", "backup", "r-1"]
+AI_ERROR_MARKERS = ("Error: Could not process request", "Error during AI processing")
+CONTROL_LINK = re.compile(r'hx-get="/controls/([^"]+)"')
+STREAM_URL = re.compile(r'data-ai-stream="([^"]+)"')
+
+
+class Sample:
+    __slots__ = ("latency", "first_chunk", "ai_error")
+
+    def __init__(self, latency: float, first_chunk: Optional[float] = None, ai_error: bool = False):
+        self.latency = latency
+        self.first_chunk = first_chunk
+        self.ai_error = ai_error
+
+
+class Scenario:
+    """One endpoint under load: `request` sends one request and returns its Sample."""
+
+    def __init__(self, name: str, request: Callable[[httpx.AsyncClient, int], Awaitable[Sample]]):
+        self.name = name
+        self.request = request
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+async def follow_stream(client: httpx.AsyncClient, html: str, start: float) -> Sample:
+    """Reads the SSE stream an AI endpoint answered with, as the browser's EventSource would."""
+    match = STREAM_URL.search(html)
+    if not match:
+        return Sample(time.perf_counter() - start, ai_error=any(marker in html for marker in AI_ERROR_MARKERS))
+    first_chunk = None
+    rendered = ""
+    async with client.stream("GET", match.group(1)) as response:
+        response.raise_for_status()
+        event, data = "message", []
+        async for line in response.aiter_lines():
+            if line:
+                field, _, value = line.partition(":")
+                value = value[1:] if value.startswith(" ") else value
+                if field == "event":
+                    event = value
+                elif field == "data":
+                    data.append(value)
+                continue
+            # A blank line ends the event; its data is every data: line joined by newlines
+            if event == "delta" and first_chunk is None:
+                first_chunk = time.perf_counter() - start
+            elif event == "rendered":
+                rendered = "\n".join(data)
+            elif event == "done":
+                break
+            event, data = "message", []
+    return Sample(
+        time.perf_counter() - start,
+        first_chunk=first_chunk,
+        ai_error=any(marker in rendered for marker in AI_ERROR_MARKERS),
+    )
+
+
+def build_scenarios(control_ids: List[str], repeat_prompts: bool) -> Dict[str, Scenario]:
+    def pick(seq: list, n: int):
+        return seq[n % len(seq)]
+
+    def text(n: int) -> str:
+        suffix = "" if repeat_prompts else f" (request {n} at {time.time_ns()})"
+        return f"We review privileged access every quarter and keep the evidence{suffix}."
+
+    async def get(client: httpx.AsyncClient, path: str) -> Sample:
+        start = time.perf_counter()
+        response = await client.get(path)
+        response.raise_for_status()
+        return Sample(time.perf_counter() - start)
+
+    async def post_ai(client: httpx.AsyncClient, path: str, data: dict) -> Sample:
+        start = time.perf_counter()
+        response = await client.post(path, data=data)
+        response.raise_for_status()
+        return await follow_stream(client, response.text, start)
+
+    async def search(client, n):
+        start = time.perf_counter()
+        response = await client.post("/search", data={"query": pick(SEARCH_QUERIES, n), "page": "1"})
+        response.raise_for_status()
+        return Sample(time.perf_counter() - start)
+
+    scenarios = [
+        Scenario("index", lambda client, n: get(client, "/")),
+        Scenario("search", search),
+        Scenario("control", lambda client, n: get(client, f"/controls/{pick(control_ids, n)}")),
+        Scenario(
+            "ai_rephrase",
+            lambda client, n: post_ai(
+                client,
+                "/ai/rephrase-text",
+                {
+                    "text": text(n),
+                    "control_id": pick(control_ids, n),
+                    "section_title": "Control Design",
+                    "element_id": "bench",
+                    "element_name": "bench",
+                    "placeholder": "",
+                },
+            ),
+        ),
+        Scenario(
+            "ai_review",
+            lambda client, n: post_ai(
+                client,
+                "/ai/review-text",
+                {"text": text(n), "control_id": pick(control_ids, n), "section_title": "Control Design"},
+            ),
+        ),
+        Scenario("ai_chat", lambda client, n: post_ai(client, "/ai/chat", {"user_message": text(n)})),
+        Scenario("admin_users", lambda client, n: get(client, "/admin/users")),
+        Scenario("admin_controls", lambda client, n: get(client, "/admin/controls")),
+        Scenario("admin_control_edit", lambda client, n: get(client, f"/admin/controls/edit/{pick(control_ids, n)}")),
+        Scenario("admin_export", lambda client, n: get(client, "/admin/controls/export")),
+    ]
+    return {scenario.name: scenario for scenario in scenarios}
+
+
+async def discover_control_ids(client: httpx.AsyncClient) -> List[str]:
+    response = await client.post("/search", data={"query": "", "page": "1"})
+    response.raise_for_status()
+    ids = list(dict.fromkeys(CONTROL_LINK.findall(response.text)))
+    if not ids:
+        raise SystemExit("No controls found; is the token valid and the catalog loaded?")
+    return ids
+
+
+async def run_scenario(
+    base_url: str, cookies: dict, scenario: Scenario, concurrency: int, duration: float, warmup: int
+) -> dict:
+    samples: List[Sample] = []
+    errors: Dict[str, int] = {}
+    counter = itertools.count()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    timeout = httpx.Timeout(120.0)
+    async with httpx.AsyncClient(base_url=base_url, cookies=cookies, limits=limits, timeout=timeout) as client:
+
+        async def one(record: bool):
+            try:
+                sample = await scenario.request(client, next(counter))
+            except httpx.HTTPError as e:
+                if record:
+                    key = f"HTTP {e.response.status_code}" if isinstance(e, httpx.HTTPStatusError) else type(e).__name__
+                    errors[key] = errors.get(key, 0) + 1
+                return
+            if record:
+                samples.append(sample)
+
+        # Open the connections and build any lazily created state before measuring
+        await asyncio.gather(*(one(record=False) for _ in range(max(warmup, concurrency))))
+
+        async def client_loop(deadline: float):
+            while time.perf_counter() < deadline:
+                await one(record=True)
+
+        start = time.perf_counter()
+        deadline = start + duration
+        await asyncio.gather(*(client_loop(deadline) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies = sorted(sample.latency * 1000 for sample in samples)
+    first_chunks = sorted(sample.first_chunk * 1000 for sample in samples if sample.first_chunk is not None)
+    result = {
+        "scenario": scenario.name,
+        "concurrency": concurrency,
+        "requests": len(samples),
+        "errors": sum(errors.values()),
+        "error_kinds": errors,
+        "ai_errors": sum(sample.ai_error for sample in samples),
+        # Requests still running at the deadline finish and count, so divide by the actual elapsed time
+        "rps": len(samples) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "max_ms": latencies[-1] if latencies else 0.0,
+    }
+    if first_chunks:
+        result["first_chunk_p50_ms"] = percentile(first_chunks, 0.50)
+        result["first_chunk_p95_ms"] = percentile(first_chunks, 0.95)
+    return result
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_comparison(results: List[dict], baseline_path: Path):
+    baseline = {
+        (result["scenario"], result["concurrency"]): result
+        for result in json.loads(baseline_path.read_text())["results"]
+    }
+    print(f"\nChange from {baseline_path} (higher latency or lower req/s is a regression)")
+    print(f"{'scenario':<20}{'conc':>6}{'p50':>9}{'p95':>9}{'p99':>9}{'req/s':>9}")
+
+    def change(new: float, old: float) -> str:
+        return f"{(new - old) / old:+.0%}" if old else "n/a"
+
+    for result in results:
+        old = baseline.get((result["scenario"], result["concurrency"]))
+        if old is None:
+            continue
+        print(
+            f"{result['scenario']:<20}{result['concurrency']:>6}"
+            f"{change(result['p50_ms'], old['p50_ms']):>9}{change(result['p95_ms'], old['p95_ms']):>9}"
+            f"{change(result['p99_ms'], old['p99_ms']):>9}{change(result['rps'], old['rps']):>9}"
+        )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--token", default="", help="admin session token sent as the auth cookie")
+    parser.add_argument("--cookie-name", default="auth_token_session")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8], help="one run per level")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per scenario and level")
+    parser.add_argument("--warmup", type=int, default=0, help="unmeasured requests before each run")
+    parser.add_argument("--repeat-prompts", action="store_true", help="send the same AI text every time")
+    parser.add_argument("--output", type=Path, help="results file (default: benchmarks/results/<UTC time>.json)")
+    parser.add_argument("--compare", type=Path, help="earlier results file to compare with")
+    parser.add_argument("--label", default="", help="free-form note saved with the results, e.g. the release")
+    parser.add_argument("scenarios", nargs="*", help="scenarios to run (default: all)")
+    args = parser.parse_args()
+
+    known = list(build_scenarios([], args.repeat_prompts))
+    unknown = [name for name in args.scenarios if name not in known]
+    if unknown:
+        parser.error(f"unknown scenarios {unknown}; choose from {known}")
+
+    cookies = {args.cookie_name: args.token} if args.token else {}
+    async with httpx.AsyncClient(base_url=args.base_url, cookies=cookies) as client:
+        control_ids = await discover_control_ids(client)
+    scenarios = build_scenarios(control_ids, args.repeat_prompts)
+    selected = [scenarios[name] for name in args.scenarios or scenarios]
+
+    started_at = datetime.now(timezone.utc)
+    print(f"{args.base_url}  duration={args.duration:g}s  controls={len(control_ids)}")
+    print(
+        f"{'scenario':<20}{'conc':>6}{'requests':>10}{'errors':>8}{'ai err':>8}"
+        f"{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+    )
+    results = []
+    for concurrency in args.concurrency:
+        for scenario in selected:
+            result = await run_scenario(args.base_url, cookies, scenario, concurrency, args.duration, args.warmup)
+            results.append(result)
+            print(
+                f"{result['scenario']:<20}{result['concurrency']:>6}{result['requests']:>10}"
+                f"{result['errors']:>8}{result['ai_errors']:>8}{result['rps']:>9.1f}"
+                f"{result['p50_ms']:>9.1f}{result['p95_ms']:>9.1f}{result['p99_ms']:>9.1f}"
+            )
+
+    output = args.output or RESULTS_DIR / f"{started_at.strftime('%Y%m%dT%H%M%SZ')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    report = {
+        "started_at_utc": started_at.replace(tzinfo=None).isoformat(),
+        "label": args.label,
+        "git_revision": git_revision(),
+        "base_url": args.base_url,
+        "duration_seconds": args.duration,
+        "repeat_prompts": args.repeat_prompts,
+        "results": results,
+    }
+    output.write_text(json.dumps(report, indent=2))
+    print(f"\nSaved {output}")
+
+    if args.compare:
+        print_comparison(results, args.compare)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
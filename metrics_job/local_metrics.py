@@ -0,0 +1,208 @@
+"""
+Offline metrics engine: builds the same metrics.json as the BigQuery job from
+the app's JSON-lines logs on local disk (LOG_FILE_PATH files, rotated and
+optionally gzipped, or a Cloud Logging export with the fields under
+jsonPayload), with no cloud access.
+
+Each file is streamed line by line in a worker process into per-day
+HyperLogLog sketches of users and interactions, so memory depends on the
+number of days and endpoints, not on the size of the logs. The per-file
+sketches are merged as the workers finish and turned into the same daily
+rollup rows the BigQuery job reads.
+
+    python local_metrics.py logs/app.log* --output metrics.json
+"""
+
+import argparse
+import glob
+import gzip
+import hashlib
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from main import RollupRow, build_metrics
+
+# 2**14 one-byte registers per sketch: about 0.8% standard error
+DEFAULT_PRECISION = 14
+
+
+class HyperLogLog:
+    """
+    HyperLogLog distinct-count sketch (Flajolet et al., 2007) over a 64-bit
+    hash, with linear counting for small cardinalities. Sketches of the same
+    precision merge by taking the register-wise maximum.
+    """
+
+    __slots__ = ("precision", "registers")
+
+    def __init__(self, precision: int = DEFAULT_PRECISION):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, value: str):
+        hashed = int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+        index = hashed >> (64 - self.precision)
+        remaining_bits = 64 - self.precision
+        rank = remaining_bits - (hashed & ((1 << remaining_bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog"):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
+
+
+class PartialAggregate:
+    """
+    Sketches for one or more log files, keyed like the rollup: users and
+    interactions per day, and per (day, endpoint). Counting rules match the
+    BigQuery rollup, including the 'ai_cache_hit' exclusion.
+    """
+
+    def __init__(self, precision: int = DEFAULT_PRECISION):
+        self.precision = precision
+        self.day_users: Dict[date, HyperLogLog] = {}
+        self.day_interactions: Dict[date, HyperLogLog] = {}
+        self.endpoint_users: Dict[Tuple[date, str], HyperLogLog] = {}
+        self.endpoint_interactions: Dict[Tuple[date, str], HyperLogLog] = {}
+        self.events = 0
+        self.skipped_lines = 0
+
+    def _sketch(self, sketches: dict, key) -> HyperLogLog:
+        sketch = sketches.get(key)
+        if sketch is None:
+            sketch = sketches[key] = HyperLogLog(self.precision)
+        return sketch
+
+    def add(self, day: date, payload: dict):
+        self.events += 1
+        username = payload.get("username")
+        interaction_id = payload.get("interaction_id")
+        endpoint_name = payload.get("endpoint_name")
+        reached_model = payload.get("event") != "ai_cache_hit"
+
+        # Every day with log rows gets a totals row, even one without users
+        users = self._sketch(self.day_users, day)
+        interactions = self._sketch(self.day_interactions, day)
+        if username is not None:
+            users.add(str(username))
+        if reached_model and interaction_id is not None:
+            interactions.add(str(interaction_id))
+            if endpoint_name is not None:
+                if username is not None:
+                    self._sketch(self.endpoint_users, (day, endpoint_name)).add(str(username))
+                self._sketch(self.endpoint_interactions, (day, endpoint_name)).add(str(interaction_id))
+
+    def merge(self, other: "PartialAggregate"):
+        for mine, theirs in (
+            (self.day_users, other.day_users),
+            (self.day_interactions, other.day_interactions),
+            (self.endpoint_users, other.endpoint_users),
+            (self.endpoint_interactions, other.endpoint_interactions),
+        ):
+            for key, sketch in theirs.items():
+                if key in mine:
+                    mine[key].merge(sketch)
+                else:
+                    mine[key] = sketch
+        self.events += other.events
+        self.skipped_lines += other.skipped_lines
+
+    def rollup_rows(self) -> Iterator[RollupRow]:
+        for day, users in self.day_users.items():
+            yield RollupRow(day, None, users.count(), self.day_interactions[day].count())
+        for (day, endpoint_name), interactions in self.endpoint_interactions.items():
+            users = self.endpoint_users.get((day, endpoint_name))
+            yield RollupRow(day, endpoint_name, users.count() if users else 0, interactions.count())
+
+
+def open_log(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode="rt", encoding="utf-8")
+    return open(path, mode="r", encoding="utf-8")
+
+
+def parse_line(line: str) -> Optional[Tuple[date, dict]]:
+    """(UTC day, payload fields) of one log line, or None if it is not a log record."""
+    try:
+        record = json.loads(line)
+        # Cloud Logging exports nest the app's fields under jsonPayload
+        payload = record.get("jsonPayload", record)
+        timestamp = datetime.fromisoformat((record.get("timestamp") or payload["timestamp"]).replace("Z", "+00:00"))
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return None
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc)
+    return timestamp.date(), payload
+
+
+def aggregate_file(path: str, precision: int = DEFAULT_PRECISION) -> PartialAggregate:
+    """Streams one log file into a partial aggregate. Runs in a worker process."""
+    partial = PartialAggregate(precision)
+    with open_log(path) as lines:
+        for line in lines:
+            if not line.strip():
+                continue
+            parsed = parse_line(line)
+            if parsed is None:
+                partial.skipped_lines += 1
+                continue
+            partial.add(*parsed)
+    return partial
+
+
+def aggregate_logs(paths: Iterable[str], workers: Optional[int] = None, precision: int = DEFAULT_PRECISION) -> PartialAggregate:
+    """Aggregates the files in parallel, merging each partial as soon as its worker finishes."""
+    total = PartialAggregate(precision)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(aggregate_file, path, precision) for path in paths]
+        for future in as_completed(futures):
+            total.merge(future.result())
+    return total
+
+
+def expand_paths(patterns: List[str]) -> List[str]:
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) or [pattern]
+        paths += [path for path in matches if os.path.isfile(path)]
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("logs", nargs="+", help="JSON-lines log files or glob patterns (.gz is read compressed)")
+    parser.add_argument("--output", default="metrics.json")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument("--precision", type=int, default=DEFAULT_PRECISION, help="HyperLogLog precision bits")
+    args = parser.parse_args()
+
+    paths = expand_paths(args.logs)
+    if not paths:
+        parser.error("no log files found")
+
+    print(f"Aggregating {len(paths)} log file(s)...")
+    aggregate = aggregate_logs(paths, workers=args.workers, precision=args.precision)
+    final_metrics = build_metrics(aggregate.rollup_rows(), datetime.now(timezone.utc).date())
+    with open(args.output, "w", encoding="utf-8") as outfile:
+        json.dump(final_metrics, outfile, indent=2)
+    print(
+        f"Wrote {args.output} from {aggregate.events} log records "
+        f"({aggregate.skipped_lines} unparseable lines skipped)"
+    )
+
+
+if __name__ == "__main__":
+    main()
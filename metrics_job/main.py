@@ -1,13 +1,233 @@
 import os
 import json
-from datetime import datetime, timedelta
-from google.cloud import bigquery, storage
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+# Days shown in the dashboard's trend chart
+TREND_DAYS = 30
+# Days before the rollup watermark that are recomputed anyway, for late-arriving log rows
+ROLLUP_LOOKBACK_DAYS = int(os.environ.get("ROLLUP_LOOKBACK_DAYS", "1"))
+# Start of the first (full) rollup build
+EPOCH = date(1970, 1, 1)
+
+
+class RollupRow(NamedTuple):
+    """
+    One row of the daily rollup. The row with endpoint_name None holds the day's
+    totals; the others hold one endpoint each. Interactions answered from the
+    app's response cache ('ai_cache_hit') did not reach the model, so they count
+    towards active users but not interactions.
+    """
+
+    day: date
+    endpoint_name: Optional[str]
+    active_users: int
+    interactions: int
+
+
+class QueryStats(NamedTuple):
+    name: str
+    bytes_processed: int
+    bytes_billed: int
+    elapsed_ms: float
+
+
+# Rollup rows for the log rows from the date {since} on, in one pass: the (day)
+# grouping set gives the day's totals, the (day, endpoint_name) set the
+# per-endpoint rows. Kept to SQL that DuckDB also runs, so the tests can check
+# FakeWarehouse against it.
+ROLLUP_SELECT_SQL = """
+    WITH events AS (
+        SELECT
+            DATE(timestamp) AS day,
+            jsonPayload.endpoint_name AS endpoint_name,
+            jsonPayload.username AS username,
+            IF(IFNULL(jsonPayload.event, '') != 'ai_cache_hit', jsonPayload.interaction_id, NULL) AS model_interaction_id
+        FROM {log_table}
+        WHERE timestamp >= CAST({since} AS TIMESTAMP)
+    )
+    SELECT day, endpoint_name, IF(is_day_total = 1, all_users, model_users) AS active_users, interactions
+    FROM (
+        SELECT
+            day,
+            endpoint_name,
+            GROUPING(endpoint_name) AS is_day_total,
+            COUNT(DISTINCT username) AS all_users,
+            COUNT(DISTINCT IF(model_interaction_id IS NOT NULL, username, NULL)) AS model_users,
+            COUNT(DISTINCT model_interaction_id) AS interactions
+        FROM events
+        GROUP BY GROUPING SETS ((day), (day, endpoint_name))
+    )
+    WHERE is_day_total = 1 OR (endpoint_name IS NOT NULL AND interactions > 0)
+"""
+
+
+# --- Warehouses ---
+class BigQueryWarehouse:
+    """Raw app logs and the materialized daily rollup, in BigQuery."""
+
+    def __init__(self, client, log_table_id: str, rollup_table_id: str):
+        self.client = client
+        self.log_table_id = log_table_id
+        self.rollup_table_id = rollup_table_id
+        self.query_stats: List[QueryStats] = []
+
+    def refresh_rollups(self, lookback_days: int) -> Iterable[RollupRow]:
+        """
+        Rebuilds the rollup from its latest day (less lookback_days) on, then
+        streams every rollup row. Runs as one script, so it is one round trip,
+        and the log table is scanned once, for the days being rebuilt only.
+        """
+        from google.cloud import bigquery
+
+        rollup_select = ROLLUP_SELECT_SQL.format(log_table=f"`{self.log_table_id}`", since="since")
+        script = f"""
+            DECLARE since DATE;
+            CREATE TABLE IF NOT EXISTS `{self.rollup_table_id}` (
+                day DATE NOT NULL,
+                endpoint_name STRING,
+                active_users INT64 NOT NULL,
+                interactions INT64 NOT NULL
+            ) PARTITION BY day;
+            SET since = (
+                SELECT IFNULL(DATE_SUB(MAX(day), INTERVAL @lookback_days DAY), @epoch)
+                FROM `{self.rollup_table_id}`
+            );
+
+            BEGIN TRANSACTION;
+            DELETE FROM `{self.rollup_table_id}` WHERE day >= since;
+            INSERT INTO `{self.rollup_table_id}` (day, endpoint_name, active_users, interactions)
+            {rollup_select};
+            COMMIT TRANSACTION;
+
+            SELECT day, endpoint_name, active_users, interactions FROM `{self.rollup_table_id}`;
+        """
+        job_config = bigquery.QueryJobConfig(
+            query_parameters=[
+                bigquery.ScalarQueryParameter("lookback_days", "INT64", lookback_days),
+                bigquery.ScalarQueryParameter("epoch", "DATE", EPOCH),
+            ]
+        )
+        job = self.client.query(script, job_config=job_config)
+        # Rows are fetched page by page as the caller iterates
+        for row in job.result():
+            yield RollupRow(row.day, row.endpoint_name, row.active_users, row.interactions)
+        self.query_stats = self._script_stats(job)
+
+    def _script_stats(self, job) -> List[QueryStats]:
+        """Bytes and elapsed time of each statement of a finished script, then of the whole script."""
+        stats = []
+        children = sorted(self.client.list_jobs(parent_job=job.job_id), key=lambda child: child.created)
+        for index, child in enumerate(children, start=1):
+            stats.append(
+                QueryStats(
+                    f"{index}. {child.statement_type}",
+                    child.total_bytes_processed or 0,
+                    child.total_bytes_billed or 0,
+                    (child.ended - child.started).total_seconds() * 1000,
+                )
+            )
+        stats.append(
+            QueryStats(
+                "script",
+                job.total_bytes_processed or 0,
+                job.total_bytes_billed or 0,
+                (job.ended - job.started).total_seconds() * 1000,
+            )
+        )
+        return stats
+
+
+class FakeWarehouse:
+    """
+    In-memory stand-in for BigQueryWarehouse, for tests and local runs. `events`
+    are log rows as dicts with a datetime "timestamp" and the jsonPayload fields
+    (username, interaction_id, endpoint_name, event) at the top level.
+    """
+
+    def __init__(self, events: Iterable[dict] = ()):
+        self.events: List[dict] = list(events)
+        self.rollups: List[RollupRow] = []
+        self.query_stats: List[QueryStats] = []
+
+    def refresh_rollups(self, lookback_days: int) -> Iterable[RollupRow]:
+        start = time.perf_counter()
+        watermark = max((row.day for row in self.rollups), default=None)
+        since = EPOCH if watermark is None else watermark - timedelta(days=lookback_days)
+
+        users: Dict[date, set] = defaultdict(set)
+        interactions: Dict[date, set] = defaultdict(set)
+        endpoint_users: Dict[tuple, set] = defaultdict(set)
+        endpoint_interactions: Dict[tuple, set] = defaultdict(set)
+        for event in self.events:
+            day = event["timestamp"].date()
+            if day < since:
+                continue
+            cache_hit = event.get("event") == "ai_cache_hit"
+            users[day].add(event.get("username"))
+            if not cache_hit:
+                interactions[day].add(event.get("interaction_id"))
+            endpoint_name, interaction_id = event.get("endpoint_name"), event.get("interaction_id")
+            if endpoint_name is not None and interaction_id is not None and not cache_hit:
+                endpoint_users[day, endpoint_name].add(event.get("username"))
+                endpoint_interactions[day, endpoint_name].add(interaction_id)
+
+        # COUNT(DISTINCT ...) ignores NULLs
+        def distinct(values: set) -> int:
+            return len(values - {None})
+
+        self.rollups = [row for row in self.rollups if row.day < since]
+        self.rollups += [RollupRow(day, None, distinct(users[day]), distinct(interactions[day])) for day in users]
+        self.rollups += [
+            RollupRow(day, endpoint_name, distinct(endpoint_users[day, endpoint_name]), distinct(ids))
+            for (day, endpoint_name), ids in endpoint_interactions.items()
+        ]
+        self.query_stats = [QueryStats("refresh_rollups", 0, 0, (time.perf_counter() - start) * 1000)]
+        return iter(self.rollups)
+
+
+# --- Metrics ---
+def build_metrics(rollups: Iterable[RollupRow], today: date) -> dict:
+    """The metrics.json document, from the daily rollup alone."""
+    trend_start = today - timedelta(days=TREND_DAYS)
+    trend = []
+    endpoint_interactions: Dict[str, int] = defaultdict(int)
+    total_interactions = 0
+    for row in rollups:
+        if row.endpoint_name is None:
+            total_interactions += row.interactions
+            if row.day >= trend_start:
+                trend.append(row)
+        else:
+            endpoint_interactions[row.endpoint_name] += row.interactions
+    trend.sort(key=lambda row: row.day)
+    endpoints = sorted(endpoint_interactions.items(), key=lambda item: item[1], reverse=True)
+
+    return {
+        "generated_at_utc": datetime.utcnow().isoformat(),
+        "trend_data": {
+            "labels": [row.day.strftime('%Y-%m-%d') for row in trend],
+            "active_users": [row.active_users for row in trend],
+            "interactions": [row.interactions for row in trend]
+        },
+        "endpoint_data": {
+            "labels": [endpoint_name for endpoint_name, _ in endpoints],
+            "interactions": [count for _, count in endpoints]
+        },
+        # Per-day distinct counts summed: an interaction logged on both sides of midnight UTC counts twice
+        "total_interactions": total_interactions
+    }
+
 
 def run_metrics_job():
     # --- Configuration (from environment variables) ---
     PROJECT_ID = os.environ.get("GCP_PROJECT")
     BQ_TABLE_ID = os.environ.get("BQ_TABLE_ID")
     GCS_BUCKET_NAME = os.environ.get("GCS_BUCKET_NAME")
+    # Materialized daily rollup, next to the log table unless set
+    ROLLUP_TABLE_ID = os.environ.get("ROLLUP_TABLE_ID") or (f"{BQ_TABLE_ID}_daily_rollup" if BQ_TABLE_ID else None)
 
     if not all([PROJECT_ID, BQ_TABLE_ID, GCS_BUCKET_NAME]):
         print("Error: Missing one or more required environment variables.")
@@ -15,61 +235,31 @@ def run_metrics_job():
 
     print(f"Starting metrics generation job for table {BQ_TABLE_ID}...")
 
-    bq_client = bigquery.Client()
+    from google.cloud import bigquery, storage
+
+    warehouse = BigQueryWarehouse(bigquery.Client(), BQ_TABLE_ID, ROLLUP_TABLE_ID)
     storage_client = storage.Client()
-    
-    # --- Define and Run Queries ---
-    thirty_days_ago = (datetime.utcnow() - timedelta(days=30)).isoformat()
-    # Note the change to query the 'python' table
-    trend_query = f"""
-        SELECT 
-        TIMESTAMP_TRUNC(timestamp, DAY) AS d, 
-        COUNT(DISTINCT jsonPayload.username) AS u, 
-        COUNT(DISTINCT jsonPayload.interaction_id) AS i 
-        FROM `{BQ_TABLE_ID}` 
-        WHERE timestamp >= '{thirty_days_ago}' 
-        GROUP BY 1 ORDER BY 1;
-    """
-    endpoint_query = f"""
-        SELECT jsonPayload.endpoint_name as e, COUNT(DISTINCT jsonPayload.interaction_id) as i 
-        FROM `{BQ_TABLE_ID}` 
-        WHERE jsonPayload.endpoint_name IS NOT NULL AND jsonPayload.interaction_id IS NOT NULL 
-        GROUP BY 1 ORDER BY 2 DESC;
-    """
-    total_interactions_query = f"""
-        SELECT COUNT(DISTINCT jsonPayload.interaction_id) as total 
-        FROM `{BQ_TABLE_ID}` WHERE jsonPayload.interaction_id IS NOT NULL;
-    """
-        
+
     try:
-        # Execute queries and format results
-        trend_results = list(bq_client.query(trend_query).result())
-        endpoint_results = list(bq_client.query(endpoint_query).result())
-        total_interactions_result = list(bq_client.query(total_interactions_query).result())
-
-        final_metrics = {
-            "generated_at_utc": datetime.utcnow().isoformat(),
-            "trend_data": {
-                "labels": [row.d.strftime('%Y-%m-%d') for row in trend_results],
-                "active_users": [row.u for row in trend_results],
-                "interactions": [row.i for row in trend_results]
-            },
-            "endpoint_data": {
-                "labels": [row.e for row in endpoint_results if row.e],
-                "interactions": [row.i for row in endpoint_results if row.e]
-            },
-            "total_interactions": total_interactions_result[0].total if total_interactions_result else 0
-        }
+        job_started = time.perf_counter()
+        rollups = warehouse.refresh_rollups(ROLLUP_LOOKBACK_DAYS)
+        final_metrics = build_metrics(rollups, datetime.now(timezone.utc).date())
+        for stats in warehouse.query_stats:
+            print(
+                f"Query {stats.name}: {stats.bytes_processed:,} bytes processed, "
+                f"{stats.bytes_billed:,} bytes billed, {stats.elapsed_ms:.0f} ms"
+            )
+        print(f"Queries and aggregation took {(time.perf_counter() - job_started) * 1000:.0f} ms")
 
         # --- Upload to Cloud Storage (NO LONGER PUBLIC) ---
         bucket = storage_client.bucket(GCS_BUCKET_NAME)
         blob = bucket.blob("metrics.json")
         blob.upload_from_string(json.dumps(final_metrics, indent=2), content_type="application/json")
-        
+
         print(f"Successfully generated and uploaded metrics.json to gs://{GCS_BUCKET_NAME}")
     except Exception as e:
         print(f"FATAL: Error generating metrics: {e}")
         raise e
 
 if __name__ == "__main__":
-    run_metrics_job()
\ No newline at end of file
+    run_metrics_job()
@@ -0,0 +1,53 @@
+"""
+JournaledControlStore recovery: records acknowledged before and after a crash
+mid-append must all survive restarts. Run from the repository root:
+
+    python -m pytest tests
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+
+from control_store import Control, JournaledControlStore  # noqa: E402
+
+
+def make_control(control_id: str) -> Control:
+    return Control(
+        id=control_id,
+        name=f"Control {control_id}",
+        risk_id="R-001",
+        status="Active",
+        owner="Security Team",
+        risk_text="",
+        description=f"Description of {control_id}",
+        sections=[],
+    )
+
+
+def open_store(tmp_path: Path) -> JournaledControlStore:
+    return JournaledControlStore(tmp_path / "controls.csv", tmp_path / "controls.journal")
+
+
+def test_torn_final_record_is_cut_off_before_appending(tmp_path):
+    store = open_store(tmp_path)
+    store.insert(make_control("C-1"))
+    store.insert(make_control("C-2"))
+    store.close()
+
+    # Crash in the middle of appending a third record
+    with open(tmp_path / "controls.journal", mode="a", encoding="utf-8") as journal:
+        journal.write('{"op":"upsert","row":{"id":"C-3","na')
+
+    store = open_store(tmp_path)
+    assert [control.id for control in store.load_all()] == ["C-1", "C-2"]
+    store.insert(make_control("C-4"))
+    store.delete("C-1")
+    store.close()
+
+    store = open_store(tmp_path)
+    assert [control.id for control in store.load_all()] == ["C-2", "C-4"]
+    assert store.journal_records == 4
+    store.close()
+
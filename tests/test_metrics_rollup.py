@@ -0,0 +1,107 @@
+"""
+FakeWarehouse must compute the same rollup as the BigQuery SQL. The SQL runs on
+DuckDB here, over the same log rows, and both results go through build_metrics.
+Run from the repository root:
+
+    python -m pytest tests
+"""
+
+import importlib.util
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import duckdb
+
+# Loaded under its own name: metrics_job/main.py and app/main.py are both "main"
+_spec = importlib.util.spec_from_file_location(
+    "metrics_job_main", Path(__file__).resolve().parent.parent / "metrics_job" / "main.py"
+)
+metrics_job = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(metrics_job)
+
+TODAY = date(2024, 3, 10)
+
+
+def event(day_offset: int, username, interaction_id, endpoint_name, kind="ai_interaction") -> dict:
+    timestamp = datetime(2024, 3, 10, 12, 30) - timedelta(days=day_offset)
+    return {
+        "timestamp": timestamp,
+        "username": username,
+        "interaction_id": interaction_id,
+        "endpoint_name": endpoint_name,
+        "event": kind,
+    }
+
+
+EVENTS = [
+    # Today: two users on one endpoint, one also on another
+    event(0, "alice", "i-1", "summarize"),
+    event(0, "alice", "i-2", "summarize"),
+    event(0, "bob", "i-3", "summarize"),
+    event(0, "bob", "i-4", "suggest"),
+    # Answered from the response cache: an active user, not an interaction
+    event(0, "carol", "i-5", "summarize", kind="ai_cache_hit"),
+    # Page views without an endpoint or interaction
+    event(0, "dave", None, None, kind="page_view"),
+    event(0, None, None, None, kind="page_view"),
+    # Yesterday, including a log row without an event field
+    event(1, "alice", "i-6", "suggest"),
+    event(1, "erin", "i-7", None, kind=None),
+    event(1, "erin", "i-7", "suggest"),
+    # Older days, inside and outside the trend window
+    event(5, "bob", "i-8", "summarize"),
+    event(5, "carol", "i-9", "summarize", kind="ai_cache_hit"),
+    event(40, "alice", "i-10", "summarize"),
+]
+
+
+def sql_rollups(events, since: date):
+    connection = duckdb.connect()
+    connection.execute(
+        "CREATE TABLE logs (timestamp TIMESTAMP, jsonPayload STRUCT("
+        "endpoint_name VARCHAR, username VARCHAR, interaction_id VARCHAR, event VARCHAR))"
+    )
+    connection.executemany(
+        "INSERT INTO logs VALUES (?, {'endpoint_name': ?, 'username': ?, 'interaction_id': ?, 'event': ?})",
+        [
+            (e["timestamp"], e["endpoint_name"], e["username"], e["interaction_id"], e["event"])
+            for e in events
+        ],
+    )
+    query = metrics_job.ROLLUP_SELECT_SQL.format(log_table="logs", since=f"DATE '{since.isoformat()}'")
+    rows = [metrics_job.RollupRow(*row) for row in connection.execute(query).fetchall()]
+    connection.close()
+    return rows
+
+
+def sort_key(row):
+    return (row.day, row.endpoint_name or "")
+
+
+def comparable_metrics(rollups) -> dict:
+    metrics = metrics_job.build_metrics(rollups, TODAY)
+    metrics.pop("generated_at_utc", None)
+    return metrics
+
+
+def test_fake_warehouse_matches_rollup_sql():
+    fake = list(metrics_job.FakeWarehouse(EVENTS).refresh_rollups(1))
+    sql = sql_rollups(EVENTS, metrics_job.EPOCH)
+
+    assert sorted(fake, key=sort_key) == sorted(sql, key=sort_key)
+    assert comparable_metrics(fake) == comparable_metrics(sql)
+
+
+def test_incremental_refresh_matches_rollup_sql():
+    warehouse = metrics_job.FakeWarehouse(EVENTS[:8])
+    list(warehouse.refresh_rollups(1))
+    # Late rows for yesterday arrive after the first refresh
+    warehouse.events = EVENTS
+    fake = list(warehouse.refresh_rollups(1))
+
+    since = TODAY - timedelta(days=1)
+    kept = [row for row in sql_rollups(EVENTS[:8], metrics_job.EPOCH) if row.day < since]
+    sql = kept + sql_rollups(EVENTS, since)
+
+    assert sorted(fake, key=sort_key) == sorted(sql, key=sort_key)
+    assert comparable_metrics(fake) == comparable_metrics(sql)
@@ -0,0 +1,77 @@
+"""
+UserRepository after the shared change feed was pruned past a worker: the
+"settled" changes it missed must not leave tokens marked as written locally.
+Run from the repository root:
+
+    python -m pytest tests
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+
+from shared_state import SharedState  # noqa: E402
+from user_store import InMemoryUserBackend, User, UserRepository, UserWrite  # noqa: E402
+
+
+def make_user(username: str) -> User:
+    return User(
+        username=username,
+        email=f"{username}@example.com",
+        token=f"token-{username}",
+        role="user",
+        created_on="2024-03-01T09:00:00Z",
+    )
+
+
+def sync(state: SharedState, repo: UserRepository) -> bool:
+    """The user half of main.sync_shared_state; returns whether it had to resync."""
+    changes = state.poll()
+    if changes is None:
+        repo.resync()
+        return True
+    for change in changes:
+        if change.op == "delete":
+            repo.remove(change.key)
+        elif change.op == "upsert":
+            repo.upsert(User(**change.payload))
+        else:
+            repo.settle(UserWrite(**change.payload["write"]), change.payload["error"])
+    return False
+
+
+def test_pruned_feed_with_a_write_in_flight_resyncs_users(tmp_path):
+    alice, bob, mallory = make_user("alice"), make_user("bob"), make_user("mallory")
+    backend = InMemoryUserBackend([alice, bob])
+    writer = SharedState(tmp_path / "shared_state.db", retention=2)
+    reader = SharedState(tmp_path / "shared_state.db", retention=2)
+    repo = UserRepository(backend)
+    repo.apply(repo.fetch(full=True))
+
+    # Another worker adds mallory; this worker applies the change while the insert is in flight
+    writer.announce_claimed("user", mallory.token, "upsert", mallory.model_dump(), ttl_seconds=60)
+    assert not sync(reader, repo)
+    assert mallory.token in repo.users_by_token
+    assert repo.pending_writes == {mallory.token: 1}
+
+    # The insert fails and bob is deleted upstream; the feed is pruned before this worker polls again
+    insert = UserWrite(action="insert", user=mallory)
+    writer.announce_released("user", mallory.token, "settled", {"write": insert.model_dump(), "error": "boom"})
+    writer.announce_claimed("user", bob.token, "delete", None, ttl_seconds=60)
+    backend.delete_users([bob.token])
+    delete = UserWrite(action="delete", user=bob)
+    writer.announce_released("user", bob.token, "settled", {"write": delete.model_dump(), "error": None})
+
+    assert sync(reader, repo)
+    assert set(repo.users_by_token) == {alice.token}
+    assert repo.pending_writes == {}
+    assert repo.settled_at == {}
+
+    # Later refreshes treat mallory's token like any other
+    backend.insert_users([mallory])
+    repo.apply(repo.fetch(full=True))
+    assert set(repo.users_by_token) == {alice.token, mallory.token}
+
+    writer.close()
+    reader.close()